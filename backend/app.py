@@ -5,11 +5,32 @@ import os
 os.environ['XDG_CACHE_HOME'] = '/tmp/runtime-cache'
 os.environ['YFINANCE_CACHE_DIR'] = '/tmp/yfinance-cache' # Try both specific and generic
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
-import yfinance as yf
 import pandas as pd
+import numpy as np
 import datetime
+import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, TimeoutError as FutureTimeout
+
+from bar_store import BarStore
+from series_cache import SeriesCache, series_version
+from shared_cache import SharedSeriesStore
+from correlation import pairwise_corr, rolling_corr, lead_lag_corr
+from trading_calendar import TradingCalendar
+from serialize import records, candle_records, frame_columns, candle_columns, format_dates, to_json_list, round_frame, DATE_FORMAT, TIME_FORMAT
+from downsample import downsample_frame, ohlc_buckets, resample_ohlc, RESAMPLE_PERIODS
+from snapshot import SnapshotScheduler
+from screener import SCREENER_UNIVERSES, universe_version, screen
+from ticker_meta import TickerMetaCache
+from ticker_guard import frozen_since
+from providers import get_provider, label_tickers
+from intraday import IntradayStore, INTRADAY_INTERVALS
+from export import EXPORT_FORMATS, EXPORT_FIELDS, format_available, encode_panel
+from wire import FastJSONProvider, ETAG_SUFFIXES, negotiate_encoding, compress_response, compress_stream
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, RESPONSE_BYTES, STAGE_SECONDS, begin_stages, end_stages, stage, tracked_stages, current_stage_totals
+from profiling import PROFILE_HEADER, start_profile, profiled, token_matches, list_profiles, load_profile, speedscope
 
 # Set yfinance cache to /tmp for read-only filesystems (Render)
 if os.environ.get('RENDER'):
@@ -19,8 +40,36 @@ if os.environ.get('RENDER'):
     pass
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# Polling clients get a token with every /api/metals response and send it back as ?since=
+METALS_TOKEN_HEADER = 'X-Metals-Token'
+
 # Enable CORS for all domains, routes, and methods (simplest for public API)
-CORS(app)
+CORS(app, expose_headers=[METALS_TOKEN_HEADER, 'X-Profile-Id'])
+
+# Local daily bar store: /api/metals only downloads bars newer than what's on disk
+bar_store = BarStore()
+
+# Shared in-memory cache of close series used by /api/analyze
+series_cache = SeriesCache()
+
+# Behind it, close series shared by all gunicorn workers as memory-mapped files (see shared_cache.py)
+shared_series = SharedSeriesStore()
+
+# Full screener tables per (universe version, metal, range, basis, max_lag); top-N is cut per request
+screen_cache = SeriesCache()
+
+# Weekly / monthly candles resampled from stored daily bars, keyed by the daily series' content
+candle_cache = SeriesCache()
+
+# 5m / 15m / 1h bars of the METAL_TICKERS in fixed-size ring buffers (see intraday.py)
+intraday_store = IntradayStore()
+
+# Upstream fetches for /api/analyze run on one bounded pool shared by all requests,
+# and each request gives up on whatever hasn't finished within its deadline
+ANALYZE_FETCH_WORKERS = int(os.environ.get('ANALYZE_FETCH_WORKERS', 8))
+ANALYZE_DEADLINE_SECONDS = float(os.environ.get('ANALYZE_DEADLINE_SECONDS', 25))
+fetch_pool = ThreadPoolExecutor(max_workers=ANALYZE_FETCH_WORKERS, thread_name_prefix='analyze-fetch')
 
 # Map common metal names to likely Yahoo Finance tickers (Futures)
 # Note: These are futures, so they might have expiration logic, but 'GC=F' usually gives continuous contract.
@@ -58,9 +107,430 @@ def get_stock_ticker(stock_id):
         return stock_id
     return stock_id
 
+def download_metal_close(metal_ticker, start_date, end_date):
+    metal_df = get_provider().download([metal_ticker], start_date, end_date, interval="1d").get(metal_ticker)
+    if metal_df is None or metal_df.empty:
+        return pd.Series(dtype='float64')
+    return metal_df['Close']
+
+def download_stock_close(ticker, start_date, end_date):
+    provider = get_provider()
+    stock_df = provider.history(ticker, start_date, end_date, interval="1d")
+    
+    # If empty, try legacy download just in case (optional, but stick to one consistent way)
+    if stock_df.empty:
+        stock_df = provider.download([ticker], start_date, end_date, interval="1d").get(ticker)
+
+    if stock_df is None or stock_df.empty:
+        return pd.Series(dtype='float64')
+    return stock_df['Close']
+
+def lookup_ticker_info(ticker):
+    return get_provider().info(ticker)
+
+# Stock names for display come from here; a miss returns the raw ID and resolves in the background
+ticker_meta = TickerMetaCache(lookup_ticker_info)
+
+def get_stock_name(ticker, fallback_name):
+    meta = ticker_meta.get(ticker)
+    return (meta or {}).get('name') or fallback_name
+
+def load_close_series(ticker, start_date, end_date, loader):
+    # Frozen detection runs here, once per download; the flag travels with the series through
+    # both caches, so every worker answers the same
+    close = loader(ticker, start_date, end_date)
+    close.attrs['frozen_since'] = frozen_since(close.to_frame('Close'))
+    return close
+
+def get_close_series(ticker, start_date, end_date, loader):
+    # Cached + coalesced: concurrent analyses of the same ticker/range share one download
+    key = (ticker, start_date, end_date, '1d')
+    return series_cache.get_or_load(
+        key, lambda: shared_series.get_or_load(key, lambda: load_close_series(ticker, start_date, end_date, loader)))
+
+def wants_columnar(data=None):
+    # Opt-in compact format: ?format=columnar (or "format": "columnar" in a POST body)
+    fmt = request.args.get('format') or (data or {}).get('format')
+    return fmt == 'columnar'
+
+def get_max_points(data=None):
+    # Optional chart point budget: ?max_points=N (or "max_points": N in a POST body)
+    value = request.args.get('max_points') or (data or {}).get('max_points')
+    if value in (None, ''):
+        return None
+    max_points = int(value)
+    if max_points < 3:
+        raise ValueError('max_points must be at least 3')
+    return max_points
+
+def get_interval(data=None):
+    # Candle size for /api/metals: ?interval=1d (default), 1wk, 1mo or intraday 5m, 15m, 1h
+    interval = request.args.get('interval') or (data or {}).get('interval') or '1d'
+    if interval != '1d' and interval not in RESAMPLE_PERIODS and interval not in INTRADAY_INTERVALS:
+        raise ValueError('interval must be 5m, 15m, 1h, 1d, 1wk or 1mo')
+    return interval
+
+def is_daily(data=None):
+    # Correlations run on daily closes of any stock. Intraday bars are only kept (in bounded
+    # rings, see intraday.py) for the METAL_TICKERS, so only /api/metals takes an intraday interval.
+    return (request.args.get('interval') or (data or {}).get('interval') or '1d') == '1d'
+
+def get_precision(data=None):
+    # Optional rounding of prices to N significant digits: ?precision=N (or "precision": N in a POST body)
+    value = request.args.get('precision') or (data or {}).get('precision')
+    if value in (None, ''):
+        return None
+    precision = int(value)
+    if not 1 <= precision <= 17:
+        raise ValueError('precision must be between 1 and 17')
+    return precision
+
+def get_since(data=None):
+    # Incremental /api/metals polls: ?since=<token from an earlier response> or ?since=YYYY-MM-DD.
+    # Returns None when absent, else (revised_after, since_date); both None for a token issued
+    # by another bar store, which can only be answered with the full history.
+    value = request.args.get('since') or (data or {}).get('since')
+    if value in (None, ''):
+        return None
+    if '.' in value:
+        store_id, revision = value.rsplit('.', 1)
+        revision = int(revision)
+        return (revision, None) if store_id == bar_store.store_id else (None, None)
+    return None, pd.Timestamp(datetime.date.fromisoformat(value))
+
+def default_date_range(start_date, end_date):
+    # Calculate default date range if not provided (2 years)
+    if not start_date or not end_date:
+        end = datetime.datetime.now()
+        start = end - datetime.timedelta(days=730) # ~2 years
+        start_date = start.strftime('%Y-%m-%d')
+        end_date = end.strftime('%Y-%m-%d')
+    return start_date, end_date
+
+def submit_fetches(metal_ticker, stock_ids, start_date, end_date):
+    # Start every upstream fetch at once; total latency is then roughly the slowest one
+    metal_future = None
+    if metal_ticker:
+        metal_future = fetch_pool.submit(profiled(get_close_series), metal_ticker, start_date, end_date, download_metal_close)
+    stock_futures = [
+        (s_id, fetch_pool.submit(profiled(get_close_series), get_stock_ticker(s_id), start_date, end_date, download_stock_close))
+        for s_id in stock_ids
+    ]
+    return metal_future, stock_futures
+
+class FetchPlan:
+    # The upstream fetches of one request, started up front and sharing one deadline.
+    # Views are split into start_* (parse, submit) and finish_* (compute, respond) around
+    # waiting on a plan, so the same code runs blocking here or awaited in asgi.py.
+    def __init__(self, metal_ticker, stock_ids, start_date, end_date, wait_for_stocks=True):
+        self.metal_ticker = metal_ticker
+        self.deadline = time.monotonic() + ANALYZE_DEADLINE_SECONDS
+        self.metal_future, self.stock_futures = submit_fetches(metal_ticker, stock_ids, start_date, end_date)
+        # Streamed responses pick the stocks up as they land instead
+        self.wait_for_stocks = wait_for_stocks
+
+    def remaining(self):
+        return max(0, self.deadline - time.monotonic())
+
+    def metal_close(self):
+        future = self.metal_future
+        if future is None:
+            return pd.Series(dtype='float64')
+        if not future.done():
+            print(f"YF timed out for {self.metal_ticker}")
+            return pd.Series(dtype='float64')
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"YF failed for {self.metal_ticker}: {e}")
+            return pd.Series(dtype='float64')
+
+    def cancel_stocks(self):
+        for _, future in self.stock_futures:
+            future.cancel()
+
+    def wait(self):
+        # Metal first: without it there is nothing to compare the stocks against
+        with stage('fetch'):
+            if self.metal_future is not None:
+                wait([self.metal_future], timeout=self.remaining())
+                if self.metal_close().empty:
+                    return
+            if self.wait_for_stocks:
+                wait([future for _, future in self.stock_futures], timeout=self.remaining())
+
+def respond_when_fetched(started):
+    # Blocking driver for a start_* result: (plan, finish) or (None, error response)
+    fetches, finish = started
+    if fetches is None:
+        return finish
+    fetches.wait()
+    return finish()
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'series': series_cache.stats(),
+        'shared_series': shared_series.stats(),
+        'candles': candle_cache.stats(),
+        'screens': screen_cache.stats(),
+        'intraday': intraday_store.status(),
+    })
+
+@app.route('/api/tickers/health', methods=['GET'])
+def ticker_health():
+    # Circuit breakers and negative cache as seen by this worker; frozen tickers from the bar store
+    return jsonify({**get_provider().guard.status(), 'frozen': bar_store.frozen()})
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.stage_token = begin_stages(request.endpoint or 'unknown')
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint, status=response.status_code)
+    # Streamed bodies have no length up front; they show up in the request time only
+    if not response.is_streamed and response.content_length is not None:
+        RESPONSE_BYTES.observe(response.content_length, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs after a streamed body is fully sent, so streaming stages are counted too
+    token = g.pop('stage_token', None)
+    if token is not None:
+        end_stages(token)
+
+@app.after_request
+def compress_json_response(response):
+    # Registered after record_request_metrics, so it runs first and the size metric sees compressed bytes
+    return compress_response(response, request.accept_encodings)
+
+# Opt-in request profiling (see profiling.py); never for the admin / metrics endpoints themselves
+PROFILE_EXCLUDED_ENDPOINTS = {'list_request_profiles', 'get_request_profile', 'prometheus_metrics', 'static'}
+
+@app.before_request
+def start_request_profile():
+    if request.endpoint not in PROFILE_EXCLUDED_ENDPOINTS:
+        g.profile = start_profile(request.endpoint or 'unknown', request.method, request.path,
+                                  request.headers.get(PROFILE_HEADER))
+
+@app.after_request
+def tag_profiled_response(response):
+    profile = g.get('profile')
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+        if response.is_streamed:
+            # The body is produced after the request context is gone: profile until it is sent
+            response.call_on_close(partial(profile.finish, response.status_code))
+            g.profile = None
+        else:
+            g.profile_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_profile(exc):
+    # Registered after finish_request_metrics, so it runs first and still sees the stage totals
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.finish(g.get('profile_status', 500), current_stage_totals())
+
+def profiles_forbidden():
+    # Admin endpoints take the same token as header-triggered profiling; without one they don't exist
+    if not token_matches(request.headers.get(PROFILE_HEADER)):
+        return jsonify({'error': 'Not found'}), 404
+    return None
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_request_profiles():
+    forbidden = profiles_forbidden()
+    if forbidden:
+        return forbidden
+    return jsonify({'profiles': list_profiles()})
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_request_profile(profile_id):
+    forbidden = profiles_forbidden()
+    if forbidden:
+        return forbidden
+    fmt = request.args.get('format', 'speedscope')
+    if fmt not in ('speedscope', 'collapsed'):
+        return jsonify({'error': 'format must be speedscope or collapsed'}), 400
+    saved = load_profile(profile_id)
+    if saved is None:
+        return jsonify({'error': f'No profile {profile_id}'}), 404
+
+    summary, collapsed = saved
+    if fmt == 'collapsed':
+        response = Response(collapsed, mimetype='text/plain')
+        filename = f'{profile_id}.collapsed.txt'
+    else:
+        response = jsonify(speedscope(summary, collapsed))
+        filename = f'{profile_id}.speedscope.json'
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+def collect_cache_metrics():
+    caches = {
+        'series': series_cache.stats(),
+        'shared_series': shared_series.stats(),
+        'candles': candle_cache.stats(),
+        'screens': screen_cache.stats(),
+    }
+    def samples(field):
+        return [({'cache': name}, stats[field]) for name, stats in caches.items()]
+    return [
+        ('metals_cache_hits_total', 'counter', 'Cache lookups served from memory.', samples('hits')),
+        ('metals_cache_misses_total', 'counter', 'Cache lookups that had to load.', samples('misses')),
+        ('metals_cache_coalesced_total', 'counter', 'Lookups that waited on an in-flight load.', samples('coalesced')),
+        ('metals_cache_evictions_total', 'counter', 'Entries dropped to stay under the size limit.', samples('evictions')),
+        ('metals_cache_entries', 'gauge', 'Entries currently cached.', samples('size')),
+    ]
+
+REGISTRY.add_collector(collect_cache_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text exposition; numbers are per process (each gunicorn worker reports its own)
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def series_data(df, fields, layout, max_points, precision):
+    # Chart data for one entry: row-of-dicts ('rows') or one dates array plus value arrays ('columnar')
+    df = round_frame(downsample_frame(df, max_points), precision)
+    if layout == 'columnar':
+        return frame_columns(df[list(fields.values())].set_axis(list(fields.keys()), axis=1))
+    return {'data': records(df, fields)}
+
+# Calendar key of the metal series; stocks are keyed by their stock_id
+METAL_KEY = ('metal',)
+
+def build_stock_entry(s_id, ticker, stock_name, stock_close, calendar, layout, max_points, precision):
+    entry = {
+        'stock_id': s_id,
+        'stock_name': stock_name,
+        'ticker': ticker,
+    }
+    # Flagged when the series was downloaded; a flat-lined symbol correlates with nothing
+    frozen = stock_close.attrs.get('frozen_since')
+    if frozen is not None:
+        entry['frozen_since'] = frozen.strftime('%Y-%m-%d')
+
+    # Align with Metal (if exists) for correlation
+    if METAL_KEY in calendar:
+        with stage('align'):
+            _, values = calendar.gather([s_id, METAL_KEY])
+        
+        if len(values) == 0:
+            correlation = 0
+        else:
+            # Same computation as Series.corr on the aligned pair
+            with stage('correlate'), np.errstate(divide='ignore', invalid='ignore'):
+                correlation = np.corrcoef(values[:, 0], values[:, 1])[0, 1]
+            if pd.isna(correlation): correlation = 0
+        entry['correlation'] = correlation
+        columns = {'stock_price': s_id, 'metal_price': METAL_KEY}
+    else:
+        # No metal selected, just return stock data (handle NaNs)
+        entry['correlation'] = None # Indicate no correlation
+        columns = {'stock_price': s_id}
+
+    if layout:
+        with stage('serialize'):
+            combined = calendar.frame(columns)
+            entry.update(series_data(combined, dict(zip(columns, columns)), layout, max_points, precision))
+    return entry
+
+def build_pair_entry(id1, id2, corr, calendar, layout, max_points, precision):
+    pair = {
+        'stock1': id1,
+        'stock2': id2,
+        'correlation': float(corr) if not pd.isna(corr) else 0,
+    }
+    if layout:
+        # Normalize or just raw prices? User asked for stock price.
+        # Raw prices usually fine for separate axes or normalized. 
+        # Our chart handles dual axes, so we can send raw.
+        with stage('serialize'):
+            panel = calendar.frame({'price1': id1, 'price2': id2})
+            pair.update(series_data(panel, {'price1': 'price1', 'price2': 'price2'}, layout, max_points, precision))
+    return pair
+
+def get_stream_format(data=None):
+    # Opt-in streaming: ?stream=ndjson|sse (or "stream": ... in the POST body)
+    fmt = request.args.get('stream') or (data or {}).get('stream')
+    return fmt if fmt in ('ndjson', 'sse') else None
+
+def stream_analysis(stream_format, metal_ticker, metal_series, stock_futures, deadline, layout, max_points, precision):
+    # The view returns (and its stage totals are flushed) before the body is generated,
+    # so the streamed part keeps its own per-stage accounting
+    with tracked_stages('analyze'):
+        yield from analysis_events(stream_format, metal_ticker, metal_series, stock_futures, deadline, layout, max_points, precision)
+
+def analysis_events(stream_format, metal_ticker, metal_series, stock_futures, deadline, layout, max_points, precision):
+    # Emits the metal first, then every stock as soon as its fetch lands, then each
+    # stock pair as soon as both sides are in. Nothing but the stock series is retained.
+    def emit(event, payload):
+        with stage('serialize'):
+            if stream_format == 'sse':
+                return f"event: {event}\ndata: {app.json.dumps(payload, separators=(',', ':'))}\n\n"
+            return app.json.dumps({'type': event, **payload}, separators=(',', ':')) + '\n'
+
+    calendar = TradingCalendar()
+    metal = {'metal_ticker': metal_ticker if metal_ticker else 'None'}
+    if not metal_series.empty:
+        calendar.add(METAL_KEY, metal_series)
+        metal.update(series_data(calendar.frame({'metal_price': METAL_KEY}), {'metal_price': 'metal_price'}, layout, max_points, precision))
+    yield emit('metal', metal)
+
+    pending = {future: s_id for s_id, future in stock_futures}
+    # Pairs come out in stock_ids order (stock1 before stock2), as in the batch response
+    position = {}
+    for s_id, _ in stock_futures:
+        position.setdefault(s_id, len(position))
+    ready = []
+    try:
+        for future in as_completed(list(pending), timeout=max(0, deadline - time.monotonic())):
+            s_id = pending.pop(future)
+            ticker = get_stock_ticker(s_id)
+            try:
+                stock_name = get_stock_name(ticker, s_id)
+                stock_close = future.result()
+                if stock_close.empty:
+                    yield emit('stock_result', {'stock_id': s_id, 'stock_name': stock_name, 'error': 'No data'})
+                    continue
+
+                with stage('align'):
+                    calendar.add(s_id, stock_close)
+                yield emit('stock_result', build_stock_entry(s_id, ticker, stock_name, stock_close, calendar, layout, max_points, precision))
+            except Exception as e:
+                yield emit('stock_result', {'stock_id': s_id, 'stock_name': s_id, 'error': str(e)})
+                continue
+
+            for other_id in ready:
+                id1, id2 = sorted((other_id, s_id), key=position.get)
+                with stage('align'):
+                    _, values = calendar.gather([id1, id2])
+                if len(values) == 0:
+                    continue
+                with stage('correlate'):
+                    corr, _ = pairwise_corr(values)
+                yield emit('stock_vs_stock', build_pair_entry(id1, id2, corr[0, 1], calendar, layout, max_points, precision))
+            if s_id not in ready:
+                ready.append(s_id)
+    except FutureTimeout:
+        for future, s_id in pending.items():
+            future.cancel()
+            yield emit('stock_result', {'stock_id': s_id, 'stock_name': s_id, 'error': 'Timed out'})
+
+    yield emit('done', {})
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze():
-    data = request.json
+    return respond_when_fetched(start_analysis(request.json))
+
+def start_analysis(data):
     stock_ids = data.get('stock_ids', [])
     # Support legacy single stock_id for backward compatibility (optional, but good practice)
     if not stock_ids and 'stock_id' in data:
@@ -69,41 +539,60 @@ def analyze():
     metal_name = data.get('metal')
     start_date = data.get('start_date')
     end_date = data.get('end_date')
+    columnar = wants_columnar(data)
+    stream_format = get_stream_format(data)
+    try:
+        max_points = get_max_points(data)
+        precision = get_precision(data)
+    except ValueError:
+        return None, (jsonify({'error': 'Invalid max_points or precision'}), 400)
 
     if not stock_ids:
-        return jsonify({'error': 'Missing stock_ids'}), 400
+        return None, (jsonify({'error': 'Missing stock_ids'}), 400)
+    if not is_daily(data):
+        return None, (jsonify({'error': 'Correlations use daily closes; interval is only supported by /api/metals'}), 400)
 
-    # Calculate default date range if not provided (2 years)
-    if not start_date or not end_date:
-        end = datetime.datetime.now()
-        start = end - datetime.timedelta(days=730) # ~2 years
-        start_date = start.strftime('%Y-%m-%d')
-        end_date = end.strftime('%Y-%m-%d')
+    start_date, end_date = default_date_range(start_date, end_date)
     
+    metal_ticker = METAL_TICKERS.get(metal_name) if metal_name else None
+    fetches = FetchPlan(metal_ticker, stock_ids, start_date, end_date, wait_for_stocks=not stream_format)
+    return fetches, partial(finish_analysis, fetches, metal_name, columnar, stream_format, max_points, precision)
+
+def finish_analysis(fetches, metal_name, columnar, stream_format, max_points, precision):
+    metal_ticker = fetches.metal_ticker
+    stock_futures = fetches.stock_futures
+
     # 1. Fetch Metal Data (Optional)
-    metal_ticker = None
     metal_series = pd.Series(dtype='float64')
     
     if metal_name:
-        metal_ticker = METAL_TICKERS.get(metal_name)
-        if metal_ticker:
-            try:
-                metal_df = yf.download(metal_ticker, start=start_date, end=end_date, interval="1d", progress=False)
-                if not metal_df.empty:
-                     # Ensure index is datetime and consistent
-                     metal_df.index = pd.to_datetime(metal_df.index).tz_localize(None)
-
-                     if isinstance(metal_df.columns, pd.MultiIndex):
-                         metal_close = metal_df['Close'].iloc[:, 0]
-                     else:
-                         metal_close = metal_df['Close']
-                     metal_series = metal_close.rename('metal_price')
-            except Exception as e:
-                print(f"YF failed for {metal_name}: {e}")
+        metal_close = fetches.metal_close()
+        if not metal_close.empty:
+             metal_series = metal_close.rename('metal_price')
 
         if metal_series.empty:
+            fetches.cancel_stocks()
             return jsonify({'error': f'Could not fetch data for metal: {metal_name}'}), 404
 
+    if stream_format:
+        # Streamed entries can't point into a shared table, so each one carries its own data
+        layout = 'columnar' if columnar else 'rows'
+        events = stream_analysis(stream_format, metal_ticker, metal_series, stock_futures, fetches.deadline, layout, max_points, precision)
+        mimetype = 'text/event-stream' if stream_format == 'sse' else 'application/x-ndjson'
+        encoding = negotiate_encoding(request.accept_encodings)
+        if encoding:
+            response = Response(compress_stream(stream_with_context(events), encoding), mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        else:
+            response = Response(stream_with_context(events), mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no' # don't let a reverse proxy hold the chunks back
+        return response
+
+    # Columnar responses reference one shared price table instead of per-entry data
+    layout = None if columnar else 'rows'
+
     # 2. Fetch Data for Each Stock
     results = {
         'metal_ticker': metal_ticker if metal_ticker else 'None',
@@ -111,90 +600,35 @@ def analyze():
         'stock_vs_stock': []    # List of { id1, id2, correlation, data: [...] }
     }
     
-    stock_series_map = {} # Store series for stock-to-stock comparison logic
+    # Every series is put on one shared day axis once; all the comparisons below gather from it
+    calendar = TradingCalendar()
+    if not metal_series.empty:
+        with stage('align'):
+            calendar.add(METAL_KEY, metal_series)
+    stock_names = {} # Stocks with data, for stock-to-stock comparison logic
 
-    for s_id in stock_ids:
+    for s_id, future in stock_futures:
         ticker = get_stock_ticker(s_id)
+        if not future.done():
+            # Out of time budget: report it and free the pool slot if it never started
+            future.cancel()
+            results['stock_results'].append({'stock_id': s_id, 'stock_name': s_id, 'error': 'Timed out'})
+            continue
         try:
-            stock_ticker_obj = yf.Ticker(ticker)
-            
-            # Fetch Stock Name (Try to get descriptive name)
-            stock_name = s_id
-            try:
-                info = stock_ticker_obj.info
-                # Prefer shortName, then longName, then default to s_id
-                name_candidate = info.get('shortName') or info.get('longName')
-                if name_candidate:
-                    stock_name = name_candidate
-            except:
-                pass # processing continues if info fails
-
-            stock_df = stock_ticker_obj.history(start=start_date, end=end_date, interval="1d") # Use history for Ticker obj
-            
-            # If empty, try legacy download just in case (optional, but stick to one consistent way)
-            if stock_df.empty:
-                stock_df = yf.download(ticker, start=start_date, end=end_date, interval="1d", progress=False)
+            stock_name = get_stock_name(ticker, s_id)
+            stock_close = future.result()
 
-            if stock_df.empty:
+            if stock_close.empty:
                 results['stock_results'].append({'stock_id': s_id, 'stock_name': stock_name, 'error': 'No data'})
                 continue
-
-            if isinstance(stock_df.columns, pd.MultiIndex):
-                 stock_close = stock_df['Close'].iloc[:, 0]
-            else:
-                 stock_close = stock_df['Close']
-            
-            # Ensure stock index is tz-naive for compatibility
-            stock_close.index = pd.to_datetime(stock_close.index).tz_localize(None)
             
-            s_series = stock_close.rename('stock_price')
-            stock_series_map[s_id] = {'series': s_series, 'name': stock_name} # Store for later
-
-            # Align with Metal (if exists) for correlation
-            if not metal_series.empty:
-                combined = pd.concat([s_series, metal_series], axis=1).dropna()
-                
-                if combined.empty:
-                    correlation = 0
-                    chart_data = []
-                else:
-                    correlation = combined['stock_price'].corr(combined['metal_price'])
-                    if pd.isna(correlation): correlation = 0
-                    
-                    chart_data = []
-                    for date, row in combined.iterrows():
-                        chart_data.append({
-                            'date': date.strftime('%Y-%m-%d'),
-                            'stock_price': float(row['stock_price']),
-                            'metal_price': float(row['metal_price'])
-                        })
-                
-                results['stock_results'].append({
-                    'stock_id': s_id,
-                    'stock_name': stock_name,
-                    'ticker': ticker,
-                    'correlation': correlation,
-                    'data': chart_data
-                })
-            else:
-                # No metal selected, just return stock data
-                chart_data = []
-                # Just use stock series, handle NaNs
-                s_series_clean = s_series.dropna()
-                for date, price in s_series_clean.items():
-                    chart_data.append({
-                        'date': date.strftime('%Y-%m-%d'),
-                        'stock_price': float(price),
-                        # No metal_price
-                    })
-
-                results['stock_results'].append({
-                    'stock_id': s_id,
-                    'stock_name': stock_name,
-                    'ticker': ticker,
-                    'correlation': None, # Indicate no correlation
-                    'data': chart_data
-                })
+            with stage('align'):
+                calendar.add(s_id, stock_close)
+            stock_names[s_id] = stock_name # Store for later
+
+            results['stock_results'].append(
+                build_stock_entry(s_id, ticker, stock_name, stock_close, calendar, layout, max_points, precision)
+            )
 
         except Exception as e:
             results['stock_results'].append({'stock_id': s_id, 'stock_name': s_id, 'error': str(e)})
@@ -205,96 +639,531 @@ def analyze():
     # If 3 stocks A, B, C? A vs B, A vs C, B vs C?
     # For simplicity and typical usage, let's do all unique pairs.
     
-    ids_list = list(stock_series_map.keys())
+    # Align every stock once and get the whole correlation matrix in one vectorized pass
+    ids_list = list(stock_names.keys())
+    with stage('align'):
+        _, panel = calendar.gather(ids_list, how='any')
+    with stage('correlate'):
+        corr_matrix, overlap = pairwise_corr(panel) if ids_list else (None, None)
+
     for i in range(len(ids_list)):
         for j in range(i + 1, len(ids_list)):
             id1 = ids_list[i]
             id2 = ids_list[j]
-            
-            s1 = stock_series_map[id1]['series'].rename('price1')
-            s2 = stock_series_map[id2]['series'].rename('price2')
-            
-            combined_pair = pd.concat([s1, s2], axis=1, join='inner').dropna()
-            
-            if not combined_pair.empty:
-                corr = combined_pair['price1'].corr(combined_pair['price2'])
-                
-                # Normalize or just raw prices? User asked for stock price.
-                # Raw prices usually fine for separate axes or normalized. 
-                # Our chart handles dual axes, so we can send raw.
-                
-                pair_data = []
-                for date, row in combined_pair.iterrows():
-                    pair_data.append({
-                        'date': date.strftime('%Y-%m-%d'),
-                        'price1': float(row['price1']),
-                        'price2': float(row['price2'])
-                    })
-
-                results['stock_vs_stock'].append({
-                    'stock1': id1,
-                    'stock2': id2,
-                    'correlation': corr if not pd.isna(corr) else 0,
-                    'data': pair_data
-                })
-
-    return jsonify(results)
 
-@app.route('/api/metals', methods=['GET'])
-def get_metals_data():
-    end = datetime.datetime.now()
-    start = end - datetime.timedelta(days=1095) # 3 years data
-    
-    
+            if overlap[i, j] == 0:
+                continue
+
+            results['stock_vs_stock'].append(
+                build_pair_entry(id1, id2, corr_matrix[i, j], calendar, layout, max_points, precision)
+            )
+
+    if ids_list:
+        results['correlation_matrix'] = {
+            'ids': ids_list,
+            'values': [[None if pd.isna(v) else float(v) for v in row] for row in corr_matrix],
+        }
+
+    if columnar:
+        # One shared date axis; stock_results / stock_vs_stock entries reference prices by stock_id
+        columns = {'metal_price': METAL_KEY} if METAL_KEY in calendar else {}
+        columns.update({s_id: s_id for s_id in ids_list})
+        results['format'] = 'columnar'
+        with stage('serialize'):
+            panel = calendar.frame(columns, how='any')
+            results.update(frame_columns(round_frame(downsample_frame(panel, max_points), precision)))
+
+    with stage('serialize'):
+        return jsonify(results)
+
+DEFAULT_ROLLING_WINDOWS = [30, 60, 120]
+DEFAULT_MAX_LAG = 20
+MAX_LAG_LIMIT = 250
+
+@app.route('/api/correlation/rolling', methods=['POST'])
+def rolling_correlation():
+    # Rolling-window and lead/lag correlation of each stock against one metal
+    return respond_when_fetched(start_rolling_correlation(request.json or {}))
+
+def start_rolling_correlation(data):
+    stock_ids = data.get('stock_ids', [])
+    metal_name = data.get('metal')
+    metal_ticker = METAL_TICKERS.get(metal_name)
+    basis = data.get('basis', 'returns') # daily returns by default: lagged correlation of price levels is mostly trend
+
+    if not stock_ids:
+        return None, (jsonify({'error': 'Missing stock_ids'}), 400)
+    if not metal_ticker:
+        return None, (jsonify({'error': f'Unknown metal: {metal_name}'}), 400)
+    if not is_daily(data):
+        return None, (jsonify({'error': 'Correlations use daily closes; interval is only supported by /api/metals'}), 400)
+    try:
+        windows = sorted({int(w) for w in data.get('windows', DEFAULT_ROLLING_WINDOWS)})
+        max_lag = int(data.get('max_lag', DEFAULT_MAX_LAG))
+    except (TypeError, ValueError):
+        return None, (jsonify({'error': 'windows must be a list of integers and max_lag an integer'}), 400)
+    if not windows or windows[0] < 3 or not 0 <= max_lag <= MAX_LAG_LIMIT or basis not in ('price', 'returns'):
+        return None, (jsonify({'error': 'Invalid windows, max_lag or basis'}), 400)
+
+    start_date, end_date = default_date_range(data.get('start_date'), data.get('end_date'))
+    fetches = FetchPlan(metal_ticker, stock_ids, start_date, end_date)
+    return fetches, partial(finish_rolling_correlation, fetches, metal_name, basis, windows, max_lag)
+
+def finish_rolling_correlation(fetches, metal_name, basis, windows, max_lag):
+    metal_ticker = fetches.metal_ticker
+    metal_close = fetches.metal_close()
+    if metal_close.empty:
+        fetches.cancel_stocks()
+        return jsonify({'error': f'Could not fetch data for metal: {metal_name}'}), 404
+
+    results = {
+        'metal_ticker': metal_ticker,
+        'basis': basis,
+        'windows': windows,
+        'max_lag': max_lag,
+        'stock_results': [],
+    }
+
+    calendar = TradingCalendar()
+    with stage('align'):
+        calendar.add(METAL_KEY, metal_close)
+
+    for s_id, future in fetches.stock_futures:
+        ticker = get_stock_ticker(s_id)
+        if not future.done():
+            future.cancel()
+            results['stock_results'].append({'stock_id': s_id, 'stock_name': s_id, 'error': 'Timed out'})
+            continue
+        try:
+            stock_name = get_stock_name(ticker, s_id)
+            stock_close = future.result()
+            if stock_close.empty:
+                results['stock_results'].append({'stock_id': s_id, 'stock_name': stock_name, 'error': 'No data'})
+                continue
+
+            with stage('align'):
+                calendar.add(s_id, stock_close)
+                rows, values = calendar.gather([METAL_KEY, s_id])
+                dates = calendar.dates(rows)
+                if basis == 'returns':
+                    # pct_change().dropna() over the common days
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        values = values[1:] / values[:-1] - 1
+                    keep = ~np.isnan(values).any(axis=1)
+                    values, dates = values[keep], dates[1:][keep]
+
+            metal_values = values[:, 0]
+            stock_values = values[:, 1]
+            with stage('correlate'):
+                rolling = rolling_corr(metal_values, stock_values, windows)
+                # Positive lag: the stock trails the metal by that many trading days
+                lags, lag_corr = lead_lag_corr(metal_values, stock_values, max_lag)
+
+            best = None
+            if not np.isnan(lag_corr).all():
+                i = int(np.nanargmax(np.abs(lag_corr)))
+                best = {'lag': int(lags[i]), 'correlation': float(lag_corr[i])}
+
+            results['stock_results'].append({
+                'stock_id': s_id,
+                'stock_name': stock_name,
+                'ticker': ticker,
+                'observations': len(values),
+                'rolling': {
+                    'dates': format_dates(dates),
+                    **{str(w): to_json_list(rolling[w]) for w in windows},
+                },
+                'lead_lag': {
+                    'lags': lags.tolist(),
+                    'correlation': to_json_list(lag_corr),
+                    'best': best,
+                },
+            })
+        except Exception as e:
+            results['stock_results'].append({'stock_id': s_id, 'stock_name': s_id, 'error': str(e)})
+
+    with stage('serialize'):
+        return jsonify(results)
+
+BATCH_DOWNLOAD_SIZE = int(os.environ.get('BATCH_DOWNLOAD_SIZE', 100))
+
+SCREENER_MAX_TICKERS = int(os.environ.get('SCREENER_MAX_TICKERS', 1000))
+SCREENER_DEFAULT_TOP_N = 20
+SCREENER_DEFAULT_MAX_LAG = 5
+SCREENER_MIN_OBSERVATIONS = 60
+SCREENER_SORT_FIELDS = ('correlation', 'abs_correlation', 'beta', 'lag_correlation')
+
+@app.route('/api/screener/universes', methods=['GET'])
+def screener_universes():
+    return jsonify({name: tickers for name, tickers in SCREENER_UNIVERSES.items()})
+
+def run_screen(metal_ticker, tickers, start_date, end_date, basis, max_lag):
+    # Whole universe in batched downloads through the bar store, then one vectorized pass
+    with stage('fetch'):
+        bars = load_daily_bars([metal_ticker, *tickers], start_date, end_date)
+    metal_close = bars[metal_ticker]['Close'].dropna()
+    if metal_close.empty:
+        return pd.DataFrame()
+    closes = {ticker: bars[ticker]['Close'].dropna() for ticker in tickers if not bars[ticker].empty}
+    with stage('correlate'):
+        return screen(metal_close, closes, basis, max_lag).reindex(tickers)
+
+@app.route('/api/screener', methods=['POST'])
+def screener():
+    # Rank a whole universe of stocks against one metal by correlation, beta or lagged correlation
+    data = request.json or {}
+    metal_name = data.get('metal')
+    metal_ticker = METAL_TICKERS.get(metal_name)
+    universe = data.get('universe')
+    stock_ids = SCREENER_UNIVERSES.get(universe) if universe else data.get('stock_ids', [])
+    basis = data.get('basis', 'returns')
+    sort_by = data.get('sort_by', 'correlation')
+
+    if not metal_ticker:
+        return jsonify({'error': f'Unknown metal: {metal_name}'}), 400
+    if stock_ids is None:
+        return jsonify({'error': f'Unknown universe: {universe}'}), 400
+    if not stock_ids or not isinstance(stock_ids, list) or not all(isinstance(s_id, str) for s_id in stock_ids):
+        return jsonify({'error': 'Missing stock_ids or universe'}), 400
+    if len(stock_ids) > SCREENER_MAX_TICKERS:
+        return jsonify({'error': f'At most {SCREENER_MAX_TICKERS} stocks per screen'}), 400
+    try:
+        top_n = int(data.get('top_n', SCREENER_DEFAULT_TOP_N))
+        max_lag = int(data.get('max_lag', SCREENER_DEFAULT_MAX_LAG))
+        min_observations = int(data.get('min_observations', SCREENER_MIN_OBSERVATIONS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'top_n, max_lag and min_observations must be integers'}), 400
+    if top_n < 1 or not 0 <= max_lag <= MAX_LAG_LIMIT or basis not in ('price', 'returns') or sort_by not in SCREENER_SORT_FIELDS:
+        return jsonify({'error': 'Invalid top_n, max_lag, basis or sort_by'}), 400
+
+    start_date, end_date = default_date_range(data.get('start_date'), data.get('end_date'))
+    ids_by_ticker = {}
+    for s_id in stock_ids:
+        ids_by_ticker.setdefault(get_stock_ticker(s_id), s_id)
+    tickers = sorted(ids_by_ticker)
+    version = universe_version(tickers)
+
+    # Repeated screens of the same universe (any top_n / sort_by) are served from here
+    key = ('screen', version, metal_ticker, start_date, end_date, basis, max_lag)
+    table = screen_cache.get_or_load(
+        key, lambda: run_screen(metal_ticker, tickers, start_date, end_date, basis, max_lag))
+    if table.empty:
+        return jsonify({'error': f'Could not fetch data for metal: {metal_name}'}), 404
+
+    usable = table['observations'] >= max(min_observations, 2)
+    ranked = table[usable]
+    order = ranked['correlation'].abs() if sort_by == 'abs_correlation' else ranked[sort_by]
+    ranked = ranked.loc[order.sort_values(ascending=False, na_position='last').index[:top_n]]
+
+    frozen = bar_store.frozen(ranked.index)
+    results = []
+    for ticker, row in ranked.iterrows():
+        s_id = ids_by_ticker[ticker]
+        results.append({
+            'stock_id': s_id,
+            'stock_name': get_stock_name(ticker, s_id),
+            'ticker': ticker,
+            'correlation': None if pd.isna(row['correlation']) else float(row['correlation']),
+            'beta': None if pd.isna(row['beta']) else float(row['beta']),
+            'lag_correlation': None if pd.isna(row['lag_correlation']) else float(row['lag_correlation']),
+            'best_lag': None if pd.isna(row['best_lag']) else int(row['best_lag']),
+            'observations': int(row['observations']),
+            **({'frozen_since': frozen[ticker]} if ticker in frozen else {}),
+        })
+
+    with stage('serialize'):
+        return jsonify({
+            'metal_ticker': metal_ticker,
+            'universe': universe or 'custom',
+            'universe_version': version,
+            'universe_size': len(tickers),
+            'screened': int(usable.sum()),
+            'basis': basis,
+            'max_lag': max_lag,
+            'sort_by': sort_by,
+            'results': results,
+            # Not enough overlapping history with the metal (or no data at all)
+            'insufficient_data': [ids_by_ticker[ticker] for ticker in table.index[~usable]],
+        })
+
+EXPORT_MAX_SERIES = int(os.environ.get('EXPORT_MAX_SERIES', 200))
+
+def get_list(data, name):
+    # ?name=a,b (or "name": [...] in a JSON body); None if it isn't a list of strings
+    value = request.args.get(name)
+    if value is not None:
+        return [item.strip() for item in value.split(',') if item.strip()]
+    value = data.get(name, [])
+    return value if isinstance(value, list) and all(isinstance(item, str) for item in value) else None
+
+@app.route('/api/export', methods=['GET', 'POST'])
+def export_panel():
+    # Aligned daily panel of metals and / or stocks as Arrow IPC, Parquet or CSV, for bulk pulls
+    data = request.get_json(silent=True) or {}
+    metals = get_list(data, 'metals')
+    stock_ids = get_list(data, 'stock_ids')
+    fields = get_list(data, 'fields') or ['close']
+    fmt = request.args.get('format') or data.get('format') or 'arrow'
+    align = request.args.get('align') or data.get('align') or 'union'
+
+    if metals is None or stock_ids is None or (not metals and not stock_ids):
+        return jsonify({'error': 'Missing metals or stock_ids'}), 400
+    unknown = [name for name in metals if name not in ALL_METAL_TICKERS]
+    if unknown:
+        return jsonify({'error': f"Unknown metal: {', '.join(unknown)}"}), 400
+    if len(metals) + len(stock_ids) > EXPORT_MAX_SERIES:
+        return jsonify({'error': f'At most {EXPORT_MAX_SERIES} series per export'}), 400
+    if fmt not in EXPORT_FORMATS or align not in ('union', 'intersection') or not set(fields) <= set(EXPORT_FIELDS):
+        return jsonify({'error': 'Invalid format, align or fields'}), 400
+    if not format_available(fmt):
+        return jsonify({'error': f'{fmt} export needs pyarrow on the server; format=csv works without it'}), 501
+
+    start_date, end_date = default_date_range(request.args.get('start_date') or data.get('start_date'),
+                                              request.args.get('end_date') or data.get('end_date'))
+    series = {name: ALL_METAL_TICKERS[name] for name in metals}
+    series.update({s_id: get_stock_ticker(s_id) for s_id in stock_ids})
+    with stage('fetch'):
+        bars = load_daily_bars(series.values(), start_date, end_date)
+
+    # Only the requested fields are put on the calendar; one field keeps plain series names
+    calendar = TradingCalendar()
+    columns = {}
+    with stage('align'):
+        for name, ticker in series.items():
+            for field in fields:
+                column = name if len(fields) == 1 else f'{name}.{field}'
+                calendar.add(column, bars[ticker][field.capitalize()])
+                columns[column] = column
+        panel = calendar.frame(columns, how='any' if align == 'union' else 'all')
+
+    with stage('serialize'):
+        body = encode_panel(panel, fmt)
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = Response(body, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="prices-{start_date}-{end_date}.{extension}"'
+    return response
+
+def refresh_daily_bars(tickers, start, end):
+    # Distinct tickers only: aliases (e.g. CRU Index / HRC Futures) share one series
+    tickers = list(dict.fromkeys(tickers))
+
+    # Only the parts of [start, end) the store hasn't covered yet are downloaded, and tickers
+    # missing the same window go into one batched download (normally all of them)
+    groups = {}
+    for ticker in tickers:
+        for window in bar_store.missing_ranges(ticker, start, end):
+            groups.setdefault(window, []).append(ticker)
+
+    for (fetch_start, fetch_end), group in groups.items():
+        # Big universes (screener) go up in bounded batches
+        for i in range(0, len(group), BATCH_DOWNLOAD_SIZE):
+            batch = group[i:i + BATCH_DOWNLOAD_SIZE]
+            try:
+                frames = get_provider().download(batch, fetch_start, fetch_end, interval="1d")
+                for ticker in batch:
+                    # A ticker left out failed or was skipped upstream: its window stays uncovered
+                    if ticker in frames:
+                        bar_store.merge(ticker, frames[ticker], fetch_start, fetch_end)
+            except Exception as e:
+                # Upstream hiccup: fall back to whatever is already stored
+                print(f"Batch fetch failed for {batch}: {e}")
+    return tickers
+
+def load_daily_bars(tickers, start, end):
+    tickers = refresh_daily_bars(tickers, start, end)
+    return {ticker: bar_store.load(ticker, start, end) for ticker in tickers}
+
+def metals_payloads(frames, variants=('rows', 'columnar'), date_format=DATE_FORMAT):
+    # {metal_name: OHLC frame} -> the requested response formats of /api/metals
+    payloads = {}
+    if 'columnar' in variants:
+        payloads['columnar'] = {'format': 'columnar', **candle_columns(frames, date_format)}
+    if 'rows' not in variants:
+        return payloads
+
     results = {}
-    
-    all_tickers = {**METAL_TICKERS, **STEEL_TICKERS}
-    
-    for metal_name, ticker in all_tickers.items():
+    for metal_name, df in frames.items():
         try:
-            # Fetch data
-            df = yf.download(ticker, start=start, end=end, interval="1d", progress=False)
-            
             if df.empty:
                 results[metal_name] = []
                 continue
-
-            # Handle MultiIndex and timezone
-            if isinstance(df.columns, pd.MultiIndex):
-                # Flatten columns by dropping the ticker level (level 1)
-                try:
-                    df.columns = df.columns.droplevel(1)
-                except Exception as e:
-                    print(f"Error dropping level for {metal_name}: {e}")
-                    # Fallback to previous robust logic if droplevel fails (unlikely)
-                    pass
-
-            df.index = pd.to_datetime(df.index).tz_localize(None)
             
             # Format for ApexCharts: { x: val, y: [o, h, l, c] }
-            data_points = []
-            for date, row in df.iterrows():
-                # Ensure we have all OHLC
-                if pd.isna(row['Open']) or pd.isna(row['Close']):
-                    continue
-                    
-                data_points.append({
-                    'x': date.strftime('%Y-%m-%d'),
-                    'y': [
-                        float(row['Open']),
-                        float(row['High']),
-                        float(row['Low']),
-                        float(row['Close'])
-                    ]
-                })
-            
-            results[metal_name] = data_points
+            results[metal_name] = candle_records(df, date_format)
             
         except Exception as e:
             print(f"Error fetching {metal_name}: {e}")
             results[metal_name] = []
 
-    return jsonify(results)
+    payloads['rows'] = results
+    return payloads
+
+METALS_HISTORY_DAYS = 1095  # 3 years data
+ALL_METAL_TICKERS = {**METAL_TICKERS, **STEEL_TICKERS}
+label_tickers(ALL_METAL_TICKERS.values())
+label_tickers(get_stock_ticker(stock_id) for universe in SCREENER_UNIVERSES.values() for stock_id in universe)
+
+def metals_token(revision):
+    return f'{bar_store.store_id}.{revision}'
+
+# Daily bars behind the latest metals snapshot, kept for max_points requests, and their token
+metals_frames = {}
+metals_version = None
+
+def build_metals_snapshot():
+    global metals_frames, metals_version
+
+    end = datetime.datetime.now()
+    start = end - datetime.timedelta(days=METALS_HISTORY_DAYS)
+    
+    with tracked_stages('metals_snapshot'):
+        # One batched download for every distinct ticker, fanned back out to each alias below
+        with stage('fetch'):
+            tickers = refresh_daily_bars(ALL_METAL_TICKERS.values(), start, end)
+            # Taken before reading the bars: a merge from another worker in between is sent
+            # again on the next poll rather than skipped
+            version = metals_token(bar_store.revision(tickers))
+            bars = {ticker: bar_store.load(ticker, start, end) for ticker in tickers}
+        metals_frames = {metal_name: bars[ticker] for metal_name, ticker in ALL_METAL_TICKERS.items()}
+        metals_version = version
+        with stage('serialize'):
+            return version, metals_payloads(metals_frames)
+
+def metals_changes(names, since, variant, precision):
+    # Bars of `names` added or revised after the since token / on or after the since date
+    revised_after, since_date = since
+    tickers = {name: ALL_METAL_TICKERS[name] for name in names}
+    start = datetime.datetime.now() - datetime.timedelta(days=METALS_HISTORY_DAYS)
+    if since_date is not None:
+        start = max(start, since_date)
+
+    # Same ordering as the snapshot: token first, then the bars
+    revision = bar_store.revision(tickers.values())
+    version = metals_token(revision)
+    if revised_after is not None and revision <= revised_after:
+        bars = {}  # the usual poll: nothing new, no need to look at any bars
+    else:
+        bars = {ticker: bar_store.load(ticker, start, revised_after=revised_after) for ticker in set(tickers.values())}
+    # Series with nothing new are left out entirely
+    frames = {name: round_frame(bars[ticker], precision) for name, ticker in tickers.items()
+              if ticker in bars and not bars[ticker].empty}
+
+    response = jsonify({
+        'token': version,
+        # True when the token wasn't ours (e.g. the store was rebuilt): bars is the whole history
+        'full': revised_after is None and since_date is None,
+        'bars': metals_payloads(frames, [variant])[variant],
+    })
+    response.headers[METALS_TOKEN_HEADER] = version
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def resampled_candles(df, interval):
+    # Memoized per (series content, interval): a snapshot rebuild that changes nothing reuses
+    # the previous result, and aliases sharing one ticker share one entry
+    if interval == '1d':
+        return df
+    return candle_cache.get_or_load((series_version(df), interval), lambda: resample_ohlc(df, interval))
+
+def dump_metals_snapshot(payload):
+    with STAGE_SECONDS.time(endpoint='metals_snapshot', stage='encode'):
+        return app.json.dumps(payload, separators=(',', ':'))
+
+# /api/metals is served from a snapshot rebuilt in the background (see snapshot.py)
+metals_snapshot = SnapshotScheduler(build_metals_snapshot, dump_metals_snapshot)
+METALS_SNAPSHOT_WAIT = float(os.environ.get('METALS_SNAPSHOT_WAIT', 60))
+
+def snapshot_response(snapshot):
+    encoding = negotiate_encoding(request.accept_encodings)
+    # Strong ETags are per representation, so each compressed body gets its own tag
+    etag = snapshot.etag + ETAG_SUFFIXES.get(encoding, '')
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.encoded[encoding] if encoding else snapshot.body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    if snapshot.version:
+        response.headers[METALS_TOKEN_HEADER] = snapshot.version
+    return response
+
+def intraday_metals_response(variant, names, interval, max_points, precision):
+    # Intraday candles straight from the ring buffers; only METAL_TICKERS get rings, which
+    # keeps their number (and so intraday memory) fixed
+    names = names or list(METAL_TICKERS)
+    unsupported = [name for name in names if name not in METAL_TICKERS]
+    if unsupported:
+        return jsonify({'error': f"Intraday intervals are not available for {', '.join(unsupported)}"}), 400
+
+    with stage('fetch'):
+        bars = intraday_store.frames({METAL_TICKERS[name] for name in names}, interval)
+    with stage('serialize'):
+        frames = {metal_name: bars[METAL_TICKERS[metal_name]] for metal_name in names}
+        if max_points:
+            frames = ohlc_buckets(frames, max_points)
+        frames = {metal_name: round_frame(df, precision) for metal_name, df in frames.items()}
+        response = jsonify(metals_payloads(frames, [variant], TIME_FORMAT)[variant])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def metals_response(variant, names=None):
+    # /api/metals (names=None: every series) or /api/metals/<name>: resampled / bucketed /
+    # rounded as requested, or only what changed since the client's token
+    try:
+        max_points = get_max_points()
+        precision = get_precision()
+        interval = get_interval()
+        since = get_since()
+    except ValueError:
+        return jsonify({'error': 'Invalid max_points, precision, interval or since'}), 400
+
+    if since is not None:
+        if max_points or interval != '1d':
+            return jsonify({'error': 'since cannot be combined with max_points or interval'}), 400
+        # Keep this worker's snapshot refreshes (and so the bar store) running
+        metals_snapshot.start()
+        return metals_changes(names or list(ALL_METAL_TICKERS), since, variant, precision)
+
+    if interval in INTRADAY_INTERVALS:
+        return intraday_metals_response(variant, names, interval, max_points, precision)
+
+    snapshot = metals_snapshot.get(variant, timeout=METALS_SNAPSHOT_WAIT)
+    if max_points or precision or interval != '1d' or names is not None:
+        # Work from the snapshot's daily bars; never goes upstream once a snapshot exists
+        if not metals_frames:
+            build_metals_snapshot()
+        # Token before frames, for the same reason as in build_metals_snapshot
+        version = metals_version
+        frames = {metal_name: resampled_candles(metals_frames[metal_name], interval) for metal_name in names or metals_frames}
+        if max_points:
+            # One set of buckets for all series, so the columnar date axis stays within max_points
+            frames = ohlc_buckets(frames, max_points)
+        frames = {metal_name: round_frame(df, precision) for metal_name, df in frames.items()}
+        response = jsonify(metals_payloads(frames, [variant])[variant])
+        response.headers[METALS_TOKEN_HEADER] = version
+        return response
+    if snapshot is None:
+        # No snapshot built yet (first build failed or is still running): build inline
+        version, payloads = build_metals_snapshot()
+        response = jsonify(payloads[variant])
+        response.headers[METALS_TOKEN_HEADER] = version
+        return response
+    return snapshot_response(snapshot)
+
+@app.route('/api/metals', methods=['GET'])
+def get_metals_data():
+    return metals_response('columnar' if wants_columnar() else 'rows')
+
+@app.route('/api/metals/<metal_name>', methods=['GET'])
+def get_metal_series(metal_name):
+    if metal_name not in ALL_METAL_TICKERS:
+        return jsonify({'error': f'Unknown metal {metal_name}'}), 404
+    return metals_response('columnar' if wants_columnar() else 'rows', [metal_name])
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,237 @@
+"""ASGI serving mode for the Flask app.
+
+    uvicorn asgi:app --workers 1 --port 5000
+
+Same routes, hooks (CORS, metrics, compression) and JSON as app.py. /api/analyze
+and /api/correlation/rolling await their upstream fetches on the event loop instead
+of blocking a worker on them, then run the pandas work in a thread pool, so one
+process can hold many analyses that are waiting on Yahoo. Every other route runs
+through the regular WSGI app in the same thread pool.
+
+Yahoo access itself is still the blocking yfinance client on app.fetch_pool; what
+is awaited here are those fetch futures.
+"""
+import io
+import os
+import sys
+import asyncio
+import contextvars
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request
+
+from app import app as flask_app, start_analysis, start_rolling_correlation
+from metrics import stage
+from profiling import profiled, detach_request_thread
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))
+
+# Pandas / serialization work and the non-async routes; waiting on Yahoo doesn't use these
+blocking_pool = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi')
+
+
+def run_blocking(fn, *args, context=None):
+    # Like asyncio.to_thread, on our own pool: the copied context carries the request context.
+    # Pass the same context to successive calls that must see each other's context changes.
+    context = context or contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(blocking_pool, context.run, profiled(fn), *args)
+
+
+def read_all(app_iter):
+    try:
+        return list(app_iter)
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+async def wait_for_fetches(fetches):
+    # Awaitable counterpart of FetchPlan.wait(): nothing blocks while Yahoo is busy
+    with stage('fetch'):
+        if fetches.metal_future is not None:
+            await asyncio.wait([asyncio.wrap_future(fetches.metal_future)], timeout=fetches.remaining())
+            if fetches.metal_close().empty:
+                return
+        if fetches.wait_for_stocks and fetches.stock_futures:
+            futures = [asyncio.wrap_future(future) for _, future in fetches.stock_futures]
+            await asyncio.wait(futures, timeout=fetches.remaining())
+
+
+async def respond_when_fetched(start, data):
+    fetches, finish = start(data)
+    if fetches is None:
+        return finish
+    await wait_for_fetches(fetches)
+    return await run_blocking(finish)
+
+
+async def analyze():
+    return await respond_when_fetched(start_analysis, request.json)
+
+
+async def rolling_correlation():
+    return await respond_when_fetched(start_rolling_correlation, request.json or {})
+
+
+# endpoint -> async view; must answer exactly like the Flask view of the same endpoint
+ASYNC_VIEWS = {
+    'analyze': analyze,
+    'rolling_correlation': rolling_correlation,
+}
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def finish_response(finish, environ):
+    # The response, its after_request hooks (compression, metrics) applied, and its body if
+    # complete. Compressing a large analysis takes long enough to stall every other request,
+    # so this runs on the pool, in a copy of the request's context.
+    response = finish()
+    body = response.get_app_iter(environ)
+    if not response.is_streamed:
+        body = read_all(body)
+    return response, body
+
+
+async def dispatch_async(view, environ):
+    # Flask's wsgi_app / full_dispatch_request with an awaited view in the middle: the
+    # request context lives in this task, so before/after/teardown hooks all apply
+    ctx = flask_app.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            rv = flask_app.preprocess_request()
+            # The loop thread runs every other request too; a profile follows this one's pool work
+            detach_request_thread()
+            if rv is None:
+                rv = await view()
+        except Exception as e:
+            rv = flask_app.handle_user_exception(e)
+        response, body = await run_blocking(finish_response, partial(flask_app.finalize_request, rv), environ)
+    except Exception as e:
+        error = e
+        response, body = await run_blocking(finish_response, partial(flask_app.handle_exception, e), environ)
+    finally:
+        ctx.pop(error)
+
+    return response.status_code, response.get_wsgi_headers(environ).to_wsgi_list(), body
+
+
+def dispatch_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    body = flask_app.wsgi_app(environ, start_response)
+    # Anything with a length is complete already; only streamed bodies are pulled chunk by chunk
+    if any(name.lower() == 'content-length' for name, _ in started['headers']):
+        body = read_all(body)
+    return started['status'], started['headers'], body
+
+
+async def send_response(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    if isinstance(body, list):
+        await send({'type': 'http.response.body', 'body': b''.join(body), 'more_body': False})
+        return
+
+    # Streamed body (NDJSON / SSE): each chunk may wait on a fetch, so pull it off the loop.
+    # One context for the whole iteration, as the generator pushes and pops Flask contexts.
+    context = contextvars.copy_context()
+    chunks = iter(body)
+    try:
+        while (chunk := await run_blocking(next, chunks, None, context=context)) is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            await run_blocking(close, context=context)
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            blocking_pool.shutdown(wait=False, cancel_futures=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        return
+    environ = build_environ(scope, body)
+
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except Exception:
+        endpoint = None  # 404 / 405: let Flask produce the usual error response
+    # CORS preflights go through Flask's automatic OPTIONS handling
+    view = ASYNC_VIEWS.get(endpoint) if scope['method'] != 'OPTIONS' else None
+
+    if view is not None:
+        status, headers, body = await dispatch_async(view, environ)
+    else:
+        status, headers, body = await run_blocking(dispatch_wsgi, environ)
+    await send_response(send, status, headers, body)
+
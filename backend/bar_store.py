@@ -0,0 +1,213 @@
+import os
+import uuid
+import sqlite3
+import threading
+import datetime
+
+import pandas as pd
+
+from ticker_guard import frozen_since
+
+# Persistent daily OHLC store so we only ever download the bars we don't have yet.
+# Defaults to /tmp because Render's filesystem is read-only outside of it.
+BAR_STORE_DIR = os.environ.get('BAR_STORE_DIR', '/tmp/metals-bar-store')
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Coverage is tracked as date ranges per ticker: every window downloaded so far, merged.
+# A request only downloads the parts of its [start, end) window outside them, and nothing
+# at all when they already cover it. The last few days before a download are left out of
+# its range: the latest daily bar is often still moving (or gets a late settlement
+# revision) when we first store it, so those days are fetched again next time.
+REFRESH_OVERLAP_DAYS = 3
+
+# Every merge that adds or changes bars bumps the store's revision and stamps those rows
+# with it, so "what changed since revision N" is one indexed query. Revisions only mean
+# something within one store file; the store id tells a client's token apart from one
+# issued before the file was recreated (e.g. /tmp wiped on a redeploy).
+BAR_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def _to_date(value):
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize()
+
+
+def _end_date(value):
+    # Exclusive end of a window as a date: an end with a time of day (e.g. now) still
+    # includes that day's bar, as it does for Yahoo
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize() if ts == ts.normalize() else ts.normalize() + datetime.timedelta(days=1)
+
+
+def _day(ts):
+    return ts.strftime('%Y-%m-%d')
+
+
+def subtract_ranges(start, end, ranges):
+    """Parts of [start, end) not covered by `ranges`, sorted disjoint (start, end) pairs."""
+    gaps = []
+    cursor = start
+    for lo, hi in ranges:
+        if hi <= cursor:
+            continue
+        if lo >= end:
+            break
+        if lo > cursor:
+            gaps.append((cursor, lo))
+        cursor = max(cursor, hi)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class BarStore:
+    def __init__(self, directory=BAR_STORE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'bars.sqlite')
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            # WAL lets the gunicorn workers read while one of them is writing
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bars ('
+                ' ticker TEXT NOT NULL, date TEXT NOT NULL,'
+                ' open REAL, high REAL, low REAL, close REAL, volume REAL,'
+                ' revision INTEGER NOT NULL DEFAULT 0,'
+                ' PRIMARY KEY (ticker, date))'
+            )
+            # Stores created before revisions existed: their bars all count as revision 0
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(bars)')]
+            if 'revision' not in columns:
+                conn.execute('ALTER TABLE bars ADD COLUMN revision INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS bars_revision ON bars (ticker, revision)')
+            conn.execute('CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute("INSERT OR IGNORE INTO store_meta VALUES ('id', ?)", (uuid.uuid4().hex[:12],))
+            conn.execute("INSERT OR IGNORE INTO store_meta VALUES ('revision', '0')")
+            # Downloaded [start_date, end_date) windows per ticker, merged so they never overlap.
+            # A ticker that only started trading later than a window's start still counts as
+            # covered from there.
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS covered ('
+                ' ticker TEXT NOT NULL, start_date TEXT NOT NULL, end_date TEXT NOT NULL,'
+                ' PRIMARY KEY (ticker, start_date))'
+            )
+            # Stores from before ranges were tracked knew one range per ticker: from the earliest
+            # start fetched to the last stored bar (less the days that are always refetched)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'coverage'").fetchone():
+                overlap = f'-{REFRESH_OVERLAP_DAYS} days'
+                conn.execute(
+                    'INSERT OR IGNORE INTO covered SELECT c.ticker, c.start, date(MAX(b.date), ?)'
+                    ' FROM coverage c JOIN bars b ON b.ticker = c.ticker'
+                    ' GROUP BY c.ticker HAVING date(MAX(b.date), ?) > c.start', (overlap, overlap)
+                )
+                conn.execute('DROP TABLE coverage')
+            # Tickers whose stored closes end in a flat run (see ticker_guard.py), and since when.
+            # Worked out whenever a merge changes a ticker's bars, over all of them.
+            conn.execute('CREATE TABLE IF NOT EXISTS frozen (ticker TEXT PRIMARY KEY, since TEXT NOT NULL)')
+            self.store_id = conn.execute("SELECT value FROM store_meta WHERE key = 'id'").fetchone()[0]
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def covered_ranges(self, ticker):
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT start_date, end_date FROM covered WHERE ticker = ? ORDER BY start_date', (ticker,)
+            ).fetchall()
+        return [(pd.Timestamp(lo), pd.Timestamp(hi)) for lo, hi in rows]
+
+    def missing_ranges(self, ticker, start, end):
+        """Date windows (start, exclusive end) to download to serve [start, end); [] if none."""
+        return subtract_ranges(_to_date(start), _end_date(end), self.covered_ranges(ticker))
+
+    def merge(self, ticker, df, start, end):
+        """Upsert the bars downloaded for [start, end) and record that window as covered."""
+        start = _to_date(start)
+        # Recent days stay uncovered so they're fetched again (see REFRESH_OVERLAP_DAYS)
+        settled = _to_date(datetime.date.today()) - datetime.timedelta(days=REFRESH_OVERLAP_DAYS)
+        end = min(_end_date(end), settled)
+        rows = []
+        if df is not None and not df.empty:
+            dates = pd.to_datetime(df.index).strftime('%Y-%m-%d')
+            columns = [df[col].astype('float64').to_numpy() if col in df.columns else [None] * len(df)
+                       for col in OHLCV_COLUMNS]
+            rows = list(zip([ticker] * len(df), dates, *columns))
+
+        with self._lock, self._connect() as conn:
+            if rows:
+                # Taking the next revision also takes SQLite's write lock, so revisions are
+                # committed in order across workers
+                conn.execute("UPDATE store_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+                revision = int(conn.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0])
+                # Re-downloaded bars that didn't change keep their old revision
+                changed = ' OR '.join(f'bars.{field} IS NOT excluded.{field}' for field in BAR_FIELDS)
+                updates = ', '.join(f'{field} = excluded.{field}' for field in BAR_FIELDS)
+                conn.executemany(
+                    f'INSERT INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, {revision})'
+                    f' ON CONFLICT(ticker, date) DO UPDATE SET {updates}, revision = excluded.revision'
+                    f' WHERE {changed}',
+                    rows
+                )
+                closes = pd.read_sql_query('SELECT date, close FROM bars WHERE ticker = ? ORDER BY date',
+                                           conn, params=[ticker], index_col='date')
+                since = frozen_since(closes.rename(columns={'close': 'Close'}))
+                if since is None:
+                    conn.execute('DELETE FROM frozen WHERE ticker = ?', (ticker,))
+                else:
+                    conn.execute('INSERT OR REPLACE INTO frozen VALUES (?, ?)', (ticker, since))
+            if start < end:
+                # Fold every range this window overlaps or touches into one
+                window = (ticker, _day(end), _day(start))
+                touching = 'WHERE ticker = ? AND start_date <= ? AND end_date >= ?'
+                lo, hi = conn.execute(f'SELECT MIN(start_date), MAX(end_date) FROM covered {touching}', window).fetchone()
+                conn.execute(f'DELETE FROM covered {touching}', window)
+                conn.execute('INSERT INTO covered VALUES (?, ?, ?)',
+                             (ticker, min(_day(start), lo or _day(start)), max(_day(end), hi or _day(end))))
+
+    def frozen(self, tickers=None):
+        """{ticker: 'YYYY-MM-DD'} of frozen tickers (among `tickers`, or all of them)."""
+        query, params = 'SELECT ticker, since FROM frozen', []
+        if tickers is not None:
+            params = list(tickers)
+            query += f" WHERE ticker IN ({', '.join('?' * len(params))})"
+        with self._connect() as conn:
+            return dict(conn.execute(query, params).fetchall())
+
+    def revision(self, tickers):
+        """Latest revision among the bars of `tickers` (0 if none are stored)."""
+        tickers = list(tickers)
+        placeholders = ', '.join('?' * len(tickers))
+        with self._connect() as conn:
+            row = conn.execute(f'SELECT MAX(revision) FROM bars WHERE ticker IN ({placeholders})', tickers).fetchone()
+        return row[0] or 0
+
+    def load(self, ticker, start=None, end=None, revised_after=None):
+        """Load stored bars for `ticker` in [start, end) as a tz-naive, date-indexed OHLCV frame.
+
+        With `revised_after`, only the bars added or changed after that revision.
+        """
+        query = 'SELECT date, open, high, low, close, volume FROM bars WHERE ticker = ?'
+        params = [ticker]
+        if revised_after is not None:
+            query += ' AND revision > ?'
+            params.append(int(revised_after))
+        if start is not None:
+            query += ' AND date >= ?'
+            params.append(_to_date(start).strftime('%Y-%m-%d'))
+        if end is not None:
+            # Exclusive, like covered windows and provider downloads
+            query += ' AND date < ?'
+            params.append(_day(_end_date(end)))
+        query += ' ORDER BY date'
+
+        with self._connect() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
+
+        df.columns = ['Date'] + OHLCV_COLUMNS
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('Date')), name='Date')
+        return df.astype('float64')
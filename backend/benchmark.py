@@ -0,0 +1,226 @@
+"""Offline benchmark for /api/analyze and /api/metals.
+
+Runs the real Flask app through its test client against fake_market.FakeMarket, so
+no network is touched and every run sees the same data. Reports p50/p95 latency,
+peak traced allocations and payload size per scenario, and compares against a saved
+baseline (exit code 1 on regression).
+
+    python benchmark.py                      # run and compare with benchmark_baseline.json
+    python benchmark.py --save-baseline      # record the current numbers as the baseline
+    python benchmark.py --filter analyze_20  # only scenarios whose name contains the text
+    python benchmark.py --latency 0.05       # simulate 50ms per upstream call
+
+Timings are machine dependent: save the baseline on the machine you compare on.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+import pandas as pd
+
+# Isolated store and no background refresh firing mid-run; must be set before importing app
+os.environ['BAR_STORE_DIR'] = tempfile.mkdtemp(prefix='metals-bench-')
+os.environ['SHARED_CACHE_DIR'] = os.path.join(os.environ['BAR_STORE_DIR'], 'shared')
+os.environ.setdefault('METALS_REFRESH_SECONDS', '86400')
+os.environ.setdefault('METALS_REFRESH_CLOSES', '')
+
+import app as backend
+from fake_market import FakeMarket
+from export import format_available
+from providers import YahooProvider, RateLimiter, set_provider
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Mix of exchanges so alignment sees TW / TWO / Tokyo / London / US calendars
+STOCK_UNIVERSE = [
+    '1605.TW', '2002.TW', '2027.TW', '2014.TW', '2006.TW', '8299.TWO', '3035.TWO',
+    '5401.JP', '5711.JP', '5713.JP', 'BHP.L', 'RIO.L', 'AAL.L', 'GLEN.L',
+    'NIKL', 'FCX', 'SCCO', 'NEM', 'AA', 'X',
+]
+
+END_DATE = '2026-06-30'
+
+
+def analyze_body(n_stocks, years, **extra):
+    end = pd.Timestamp(END_DATE)
+    start = end - pd.Timedelta(days=365 * years)
+    return {
+        'stock_ids': STOCK_UNIVERSE[:n_stocks],
+        'metal': 'Nickel',
+        'start_date': start.strftime('%Y-%m-%d'),
+        'end_date': end.strftime('%Y-%m-%d'),
+        **extra,
+    }
+
+
+def build_scenarios():
+    # name -> (request kwargs for the test client, clear caches before each run?)
+    scenarios = {
+        'metals_get': ({'method': 'GET', 'path': '/api/metals'}, False),
+        'metals_get_gzip': ({'method': 'GET', 'path': '/api/metals', 'headers': {'Accept-Encoding': 'gzip'}}, False),
+        'metals_get_columnar': ({'method': 'GET', 'path': '/api/metals?format=columnar'}, False),
+        'metals_get_max_points_200': ({'method': 'GET', 'path': '/api/metals?max_points=200'}, False),
+        'metals_get_interval_1wk': ({'method': 'GET', 'path': '/api/metals?interval=1wk'}, False),
+        'metals_get_precision_5_gzip': ({'method': 'GET', 'path': '/api/metals?precision=5',
+                                         'headers': {'Accept-Encoding': 'gzip'}}, False),
+        # A dashboard poll that is already up to date (token resolved when the request is made)
+        'metals_poll_since_token': ({'method': 'GET', 'path': lambda: '/api/metals?since=' + latest_metals_token()}, False),
+        # Intraday candles from the ring buffers (refetched at most every INTRADAY_REFRESH_SECONDS)
+        'metals_get_intraday_5m': ({'method': 'GET', 'path': '/api/metals?interval=5m'}, False),
+        'metals_get_intraday_1h_columnar': ({'method': 'GET', 'path': '/api/metals?interval=1h&format=columnar'}, False),
+    }
+    for n_stocks in (1, 5, 20):
+        for cold in (True, False):
+            body = analyze_body(n_stocks, 3)
+            name = f"analyze_{n_stocks}x3y_{'cold' if cold else 'warm'}"
+            scenarios[name] = ({'method': 'POST', 'path': '/api/analyze', 'json': body}, cold)
+    for years in (1, 10):
+        scenarios[f'analyze_5x{years}y_warm'] = (
+            {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(5, years)}, False)
+    scenarios['analyze_20x3y_columnar'] = (
+        {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(20, 3, format='columnar')}, False)
+    scenarios['analyze_20x3y_max_points_200'] = (
+        {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(20, 3, max_points=200)}, False)
+    scenarios['analyze_20x3y_gzip'] = (
+        {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(20, 3),
+         'headers': {'Accept-Encoding': 'gzip'}}, False)
+    scenarios['analyze_20x3y_precision_5'] = (
+        {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(20, 3, precision=5)}, False)
+    scenarios['analyze_5x3y_stream'] = (
+        {'method': 'POST', 'path': '/api/analyze', 'json': analyze_body(5, 3, stream='ndjson')}, False)
+    screener_body = {**analyze_body(0, 3), 'stock_ids': [f'SCR{i:03d}' for i in range(200)], 'top_n': 20}
+    for cold in (True, False):
+        # Cold recomputes from the bar store (delta downloads only); warm is a cached screen
+        scenarios[f"screener_200x3y_{'cold' if cold else 'warm'}"] = (
+            {'method': 'POST', 'path': '/api/screener', 'json': screener_body}, cold)
+    export_query = f"/api/export?metals=Gold,Copper,Nickel&stock_ids={','.join(STOCK_UNIVERSE[:20])}&start_date=2024-06-30&end_date={END_DATE}"
+    for fmt in ('csv', 'arrow', 'parquet'):
+        if format_available(fmt):
+            scenarios[f'export_20x2y_{fmt}'] = ({'method': 'GET', 'path': f'{export_query}&format={fmt}'}, False)
+    scenarios['rolling_5x3y'] = (
+        {'method': 'POST', 'path': '/api/correlation/rolling',
+         'json': {**analyze_body(5, 3), 'windows': [30, 60, 120], 'max_lag': 60}}, False)
+    return scenarios
+
+
+def latest_metals_token():
+    return backend.metals_token(backend.bar_store.revision(backend.ALL_METAL_TICKERS.values()))
+
+
+def reset_caches():
+    backend.series_cache.clear()
+    backend.shared_series.clear()
+    backend.candle_cache.clear()
+    backend.screen_cache.clear()
+
+
+def run_request(client, spec):
+    spec = dict(spec)
+    path = spec.pop('path')
+    response = client.open(path() if callable(path) else path, **spec)
+    body = response.get_data()  # drains streamed responses too
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.status_code}: {body[:200]!r}')
+    return len(body)
+
+
+def measure(client, spec, cold, iterations):
+    if cold:
+        reset_caches()
+    payload_bytes = run_request(client, spec)  # warm-up (and primes the caches for warm runs)
+
+    timings = []
+    for _ in range(iterations):
+        if cold:
+            reset_caches()
+        started = time.perf_counter()
+        run_request(client, spec)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Allocations on a separate pass: tracemalloc slows everything down
+    if cold:
+        reset_caches()
+    tracemalloc.start()
+    run_request(client, spec)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    quantiles = statistics.quantiles(timings, n=20, method='inclusive')
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(quantiles[18], 3),
+        'peak_alloc_kb': round(peak / 1024, 1),
+        'payload_bytes': payload_bytes,
+    }
+
+
+def compare(results, baseline, time_tolerance, size_tolerance):
+    regressions = []
+    limits = {'p95_ms': time_tolerance, 'peak_alloc_kb': size_tolerance, 'payload_bytes': size_tolerance}
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, tolerance in limits.items():
+            if metric in previous and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {previous[metric]} -> {current[metric]}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmark for the metals dashboard backend')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--filter', default='')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated seconds per upstream call')
+    parser.add_argument('--data-dir', help='directory of recorded <TICKER>.csv bars')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--size-tolerance', type=float, default=0.10)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    market = FakeMarket(data_dir=args.data_dir, latency=args.latency)
+    # Real Yahoo provider code path (batch split, normalization), fake upstream, no rate limit
+    set_provider(YahooProvider(client=market, rate_limiter=RateLimiter(0, 0)))
+
+    client = backend.app.test_client()
+    results = {}
+    print(f"{'scenario':<34} {'p50 ms':>9} {'p95 ms':>9} {'peak KB':>10} {'bytes':>10}")
+    for name, (spec, cold) in build_scenarios().items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(client, spec, cold, args.iterations)
+        r = results[name]
+        print(f"{name:<34} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['peak_alloc_kb']:>10.1f} {r['payload_bytes']:>10}")
+    print(f"upstream calls: {dict(market.calls)}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare against (run with --save-baseline first)')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.time_tolerance, args.size_tolerance)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
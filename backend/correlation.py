@@ -0,0 +1,144 @@
+import numpy as np
+
+# Vectorized correlation helpers shared by the analysis endpoints.
+
+
+def pairwise_corr(panel):
+    """All-pairs Pearson correlation using pairwise-complete observations.
+
+    Same result as running concat/dropna/corr for every pair, but done as a handful
+    of matrix products over the whole panel (a date-indexed frame or a dates x series
+    array with NaN gaps). Returns (corr, counts) as n x n arrays, where counts[i, j] is
+    the number of dates both i and j have a price for.
+    """
+    values = np.asarray(panel, dtype='float64')
+    mask = ~np.isnan(values)
+    valid = mask.astype('float64')
+
+    # Centre each column first so the sums below don't lose precision on large prices
+    centred = np.where(mask, values - np.nanmean(values, axis=0), 0.0)
+
+    counts = valid.T @ valid
+    sum_x = centred.T @ valid               # sum_x[i, j]: sum of x_i where i and j overlap
+    sum_xx = (centred * centred).T @ valid
+    sum_xy = centred.T @ centred
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_x.T / counts
+        var = sum_xx - sum_x * sum_x / counts
+        corr = cov / np.sqrt(var * var.T)
+
+    corr[counts < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0), counts.astype('int64')
+
+
+def rolling_corr(x, y, windows):
+    """Trailing-window Pearson correlation of two aligned arrays for several window sizes.
+
+    Uses one set of cumulative sums for all windows. Returns {window: array of len(x)},
+    NaN until the first full window.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    x = x - x.mean() if n else x
+    y = y - y.mean() if n else y
+
+    def cumsum0(a):
+        return np.concatenate(([0.0], np.cumsum(a)))
+
+    sx, sy = cumsum0(x), cumsum0(y)
+    sxx, syy, sxy = cumsum0(x * x), cumsum0(y * y), cumsum0(x * y)
+
+    out = {}
+    for w in windows:
+        result = np.full(n, np.nan)
+        if n >= w:
+            wx, wy = sx[w:] - sx[:-w], sy[w:] - sy[:-w]
+            cov = (sxy[w:] - sxy[:-w]) - wx * wy / w
+            var_x = (sxx[w:] - sxx[:-w]) - wx * wx / w
+            var_y = (syy[w:] - syy[:-w]) - wy * wy / w
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[w - 1:] = np.clip(cov / np.sqrt(var_x * var_y), -1.0, 1.0)
+        out[w] = result
+    return out
+
+
+def lead_lag_corr(x, y, max_lag):
+    """Correlation of x[t] with y[t + k] for every k in -max_lag..max_lag.
+
+    Positive k means y trails x by k observations. Every lag is measured over the same
+    core of len(x) - 2 * max_lag points, taken as strided views of y (no copies per lag).
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    lags = np.arange(-max_lag, max_lag + 1)
+    m = len(x) - 2 * max_lag
+    if m < 3:
+        return lags, np.full(len(lags), np.nan)
+
+    core = x[max_lag:max_lag + m]
+    shifted = np.lib.stride_tricks.sliding_window_view(y, m)[:2 * max_lag + 1]
+
+    core = core - core.mean()
+    shifted = shifted - shifted.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = (shifted @ core) / np.sqrt((shifted * shifted).sum(axis=1) * (core @ core))
+    return lags, np.clip(corr, -1.0, 1.0)
+
+
+def corr_with(x, matrix):
+    """Pearson correlation and beta of one series against every column of a matrix.
+
+    x is (n,), matrix is (n, m), both NaN where there is no observation; each column
+    uses the dates it shares with x. Returns (corr, beta, counts) as length-m arrays,
+    where beta is the slope of the column regressed on x.
+    """
+    x = np.asarray(x, dtype='float64')
+    values = np.asarray(matrix, dtype='float64')
+    mask = ~np.isnan(values) & ~np.isnan(x)[:, None]
+    valid = mask.astype('float64')
+
+    # Centred like pairwise_corr so the sums below don't lose precision
+    xc = np.where(np.isnan(x), 0.0, x - np.nanmean(x)) if len(x) else x
+    with np.errstate(invalid='ignore'):
+        yc = np.where(mask, values - np.nanmean(np.where(mask, values, np.nan), axis=0), 0.0)
+
+    counts = valid.sum(axis=0)
+    sum_x = xc @ valid
+    sum_xx = (xc * xc) @ valid
+    sum_y = yc.sum(axis=0)
+    sum_yy = (yc * yc).sum(axis=0)
+    sum_xy = xc @ yc
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_y / counts
+        var_x = sum_xx - sum_x * sum_x / counts
+        var_y = sum_yy - sum_y * sum_y / counts
+        corr = cov / np.sqrt(var_x * var_y)
+        beta = cov / var_x
+
+    corr[counts < 2] = np.nan
+    beta[counts < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0), beta, counts.astype('int64')
+
+
+def lagged_corr_with(x, matrix, max_lag):
+    """Correlation of x against every column at each lag in -max_lag..max_lag.
+
+    Positive lag k pairs x[t] with matrix[t + k] (the column trails x). Returns
+    (lags, corr) with corr shaped (len(lags), m).
+    """
+    x = np.asarray(x, dtype='float64')
+    values = np.asarray(matrix, dtype='float64')
+    n = len(x)
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = np.full((len(lags), values.shape[1]), np.nan)
+    for i, lag in enumerate(lags):
+        if abs(lag) >= n:
+            continue
+        if lag >= 0:
+            corr[i] = corr_with(x[:n - lag], values[lag:])[0]
+        else:
+            corr[i] = corr_with(x[-lag:], values[:n + lag])[0]
+    return lags, corr
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+# Chart-side point reduction. Only used when a client passes max_points; correlations
+# are always computed on the full-resolution series before any of this runs.
+
+
+def bucket_edges(n, n_out):
+    # First and last points are always kept; points 1..n-2 go into n_out-2 buckets [edges[i], edges[i+1])
+    return np.linspace(1, n - 1, n_out - 1).astype(int)
+
+
+def triangle_areas(x, y, edges):
+    """LTTB triangle area of points 1..n-2 in every column of y (n x k, NaN = no value).
+
+    Each point's triangle is anchored on the previous bucket's average (the first point for
+    the first bucket) and the next bucket's average (the last point for the last bucket)
+    rather than on the point picked in the previous bucket, so all buckets are scored at once.
+    """
+    counts = np.diff(edges)
+    valid = ~np.isnan(y)
+    n_valid = np.add.reduceat(valid[1:-1], edges[:-1] - 1, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # NaN for a bucket in which a column has no values
+        avg_x = np.add.reduceat(np.where(valid, x[:, None], 0)[1:-1], edges[:-1] - 1, axis=0) / n_valid
+        avg_y = np.add.reduceat(np.where(valid, y, 0)[1:-1], edges[:-1] - 1, axis=0) / n_valid
+
+    columns = np.arange(y.shape[1])
+    first = np.argmax(valid, axis=0)
+    last = len(x) - 1 - np.argmax(valid[::-1], axis=0)
+    prev_x = np.vstack([x[first], avg_x[:-1]])
+    prev_y = np.vstack([y[first, columns], avg_y[:-1]])
+    next_x = np.vstack([avg_x[1:], x[last]])
+    next_y = np.vstack([avg_y[1:], y[last, columns]])
+
+    bucket = np.repeat(np.arange(len(counts)), counts)
+    ax, ay, cx, cy = prev_x[bucket], prev_y[bucket], next_x[bucket], next_y[bucket]
+    px, py = x[1:-1, None], y[1:-1]
+    return np.abs((ax - cx) * (py - ay) - (ax - px) * (cy - ay))
+
+
+def best_per_bucket(scores, edges):
+    # Position (1..n-2) of the highest score in each bucket, the first one on ties; NaN scores lose
+    scores = np.nan_to_num(scores, nan=-1.0)
+    counts = np.diff(edges)
+    best = np.maximum.reduceat(scores, edges[:-1] - 1)
+    hits = np.flatnonzero(scores == np.repeat(best, counts))
+    bucket = np.repeat(np.arange(len(counts)), counts)[hits]
+    return hits[np.r_[True, bucket[1:] != bucket[:-1]]] + 1
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: positions of the n_out points that best keep the line's shape."""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 0)])
+
+    edges = bucket_edges(n, n_out)
+    areas = triangle_areas(np.asarray(x, dtype='float64'), np.asarray(y, dtype='float64')[:, None], edges)
+    return np.concatenate([[0], best_per_bucket(areas[:, 0], edges), [n - 1]])
+
+
+def downsample_frame(df, max_points):
+    """Reduce a date-indexed frame of line series to at most max_points rows.
+
+    Rows are picked jointly: one per bucket, the one whose triangle is largest in any
+    column, with each column's areas taken relative to its own price range so every
+    series competes on equal terms. The first and last rows are always kept.
+    """
+    n = len(df)
+    if max_points is None or n <= max_points or df.shape[1] == 0:
+        return df
+    if max_points < 3:
+        return df.iloc[[0, n - 1][:max(max_points, 0)]]
+
+    values = df.to_numpy(dtype='float64')
+    x = df.index.asi8 / 86400e9
+    edges = bucket_edges(n, max_points)
+    span = np.fmax.reduce(values, axis=0) - np.fmin.reduce(values, axis=0)
+    areas = triangle_areas(x, values, edges) / np.where(span > 0, span, 1)
+    rows = np.concatenate([[0], best_per_bucket(np.fmax.reduce(areas, axis=1), edges), [n - 1]])
+    return df.iloc[rows]
+
+
+def ohlc_buckets(frames, max_points):
+    """Aggregate {name: OHLC frame} into at most max_points candles each: first open, max high,
+    min low, last close.
+
+    Buckets are cut on the union of all series' dates and labelled by their first date, so
+    every series shares one date axis of at most max_points entries (columnar payloads).
+    """
+    frames = {name: df[df['Open'].notna() & df['Close'].notna()] for name, df in frames.items()}
+    grid = pd.DatetimeIndex(np.unique(np.concatenate([df.index.to_numpy() for df in frames.values()] or [[]])))
+    if max_points is None or len(grid) <= max_points:
+        return frames
+
+    labels = grid[np.linspace(0, len(grid), max_points + 1).astype(int)[:-1]]
+    buckets = {}
+    for name, df in frames.items():
+        bucket = labels.searchsorted(df.index, side='right') - 1
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]]) if len(df) else np.array([], dtype=int)
+        buckets[name] = aggregate_ohlc(df, starts, labels[bucket[starts]])
+    return buckets
+
+
+# Calendar period per candle interval; daily bars are served as they are
+RESAMPLE_PERIODS = {'1wk': 'W', '1mo': 'M'}
+
+
+def resample_ohlc(df, interval):
+    # Daily bars -> weekly / monthly candles, one bucket per calendar period
+    if interval not in RESAMPLE_PERIODS:
+        return df
+    df = df[df['Open'].notna() & df['Close'].notna()]
+    if df.empty:
+        return df
+
+    periods = df.index.to_period(RESAMPLE_PERIODS[interval])
+    starts = np.flatnonzero(np.r_[True, periods.asi8[1:] != periods.asi8[:-1]])
+    # Dated by the period's first day (Monday / the 1st), not its first bar, so series whose
+    # first trading day in a period differs still share one label
+    return aggregate_ohlc(df, starts, periods[starts].start_time)
+
+
+def aggregate_ohlc(df, starts, index):
+    # Sorted, gap-free OHLC frame + bucket start rows -> one candle per bucket (dated by index) via reduceat
+    if not len(starts):
+        return df.iloc[:0]
+    ends = np.append(starts[1:], len(df)) - 1
+    data = {
+        'Open': df['Open'].to_numpy(dtype='float64')[starts],
+        'High': np.fmax.reduceat(df['High'].to_numpy(dtype='float64'), starts),
+        'Low': np.fmin.reduceat(df['Low'].to_numpy(dtype='float64'), starts),
+        'Close': df['Close'].to_numpy(dtype='float64')[ends],
+    }
+    if 'Volume' in df.columns:
+        data['Volume'] = np.add.reduceat(np.nan_to_num(df['Volume'].to_numpy(dtype='float64')), starts)
+    return pd.DataFrame(data, index=pd.DatetimeIndex(index, name=df.index.name))
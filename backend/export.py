@@ -0,0 +1,45 @@
+# Binary encodings of an aligned, date-indexed price panel for bulk pulls. pyarrow is in
+# requirements.txt (Arrow is the default format); an environment without it still serves
+# CSV, and the Arrow / Parquet formats answer 501.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+EXPORT_FORMATS = {
+    # format -> (mimetype, file extension)
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'csv': ('text/csv', 'csv'),
+}
+EXPORT_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+PARQUET_COMPRESSION = 'zstd'
+
+
+def format_available(fmt):
+    return fmt == 'csv' or pa is not None
+
+
+def panel_table(panel):
+    # Date-indexed frame -> Arrow table with a date32 'date' column; the float columns are
+    # wrapped straight from their numpy buffers
+    columns = {'date': pa.array(panel.index.to_numpy().astype('datetime64[D]'))}
+    for name in panel.columns:
+        columns[str(name)] = pa.array(panel[name].to_numpy(dtype='float64'), from_pandas=True)
+    return pa.table(columns)
+
+
+def encode_panel(panel, fmt):
+    """Serialize an aligned panel as 'arrow' (IPC stream), 'parquet' or 'csv' bytes."""
+    if fmt == 'csv':
+        return panel.to_csv(index_label='date', date_format='%Y-%m-%d').encode()
+
+    table = panel_table(panel)
+    sink = pa.BufferOutputStream()
+    if fmt == 'arrow':
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink, compression=PARQUET_COMPRESSION)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,203 @@
+import os
+import time
+import zlib
+import functools
+import threading
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Deterministic offline stand-in for the parts of yfinance the app uses (yf.download,
+# yf.Ticker(...).history / .info). Frames are shaped like the real thing:
+#   - download(): (Price, Ticker) MultiIndex columns, tz-naive 'Date' index, union
+#     calendar with NaN rows when several exchanges are requested together
+#   - history(): flat columns incl. Dividends / Stock Splits, tz-aware exchange-local index
+# Bars come from <data_dir>/<TICKER>.csv (Date,Open,High,Low,Close,Volume) when recorded
+# data is available, otherwise from a seeded random walk per ticker. `failing` tickers
+# simulate an upstream outage the way yfinance 1.7 reports one: Ticker calls raise, while
+# download() swallows the error and leaves empty columns. `frozen` tickers stop moving from
+# a given date on, like ZNC=F: every price repeats the last close before it. Intraday download()s
+# (5m, 1h, ...) get synthetic bars on a UTC grid with a tz-aware 'Datetime' index.
+
+EXCHANGE_TIMEZONES = {
+    '.TWO': 'Asia/Taipei',
+    '.TW': 'Asia/Taipei',
+    '.T': 'Asia/Tokyo',
+    '.L': 'Europe/London',
+}
+
+HISTORY_START = '2000-01-03'
+HISTORY_END = '2035-12-31'
+
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+
+
+def exchange_timezone(ticker):
+    for suffix, tz in EXCHANGE_TIMEZONES.items():
+        if ticker.endswith(suffix):
+            return tz
+    return 'America/New_York'
+
+
+@functools.lru_cache(maxsize=1)
+def business_days():
+    # Generating the range is slow and it is the same for every ticker
+    return pd.bdate_range(HISTORY_START, HISTORY_END)
+
+
+def synthetic_bars(ticker):
+    rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+    dates = business_days()
+    # Each market gets its own ~2% of holidays so cross-exchange alignment has real gaps
+    dates = dates[rng.random(len(dates)) > 0.02]
+
+    n = len(dates)
+    close = rng.uniform(10, 2000) * np.exp(np.cumsum(rng.normal(0, 0.015, n)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n))
+    spread = np.abs(rng.normal(0, 0.01, n)) * close
+    df = pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Volume': rng.integers(1_000, 5_000_000, n).astype('float64'),
+    }, index=pd.DatetimeIndex(dates, name='Date'))
+    return df
+
+
+def utc_nanos(value, default):
+    # Naive datetimes are taken as UTC here
+    value = pd.Timestamp(default if value is None else value)
+    if value.tz is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return value.value
+
+
+def synthetic_intraday_bars(ticker, interval, start, end):
+    # Weekday bars on a fixed UTC grid; every bar is a function of (ticker, bar time) only,
+    # so overlapping windows agree exactly, as when refetching from Yahoo
+    step = INTRADAY_MINUTES[interval] * 60 * 10**9
+    start = utc_nanos(start, HISTORY_START)
+    end = utc_nanos(end, pd.Timestamp.now(tz='UTC'))
+    times = np.arange(-(-start // step) * step, end, step)
+    times = times[(times // (86400 * 10**9) + 3) % 7 < 5]  # 1970-01-01 was a Thursday
+
+    seed = zlib.crc32(ticker.encode())
+    base = 10 + seed % 2000
+    hours = times / 3.6e12
+    close = base * np.exp(0.03 * np.sin(hours / 41 + seed % 97) + 0.004 * np.sin(hours * 1.7 + seed % 13))
+    open_ = base * np.exp(0.03 * np.sin((hours - step / 3.6e12) / 41 + seed % 97)
+                          + 0.004 * np.sin((hours - step / 3.6e12) * 1.7 + seed % 13))
+    spread = 0.0005 * close * (1 + np.abs(np.sin(hours * 7.3)))
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Volume': np.round(1_000 + 500 * np.abs(np.sin(hours * 3.1))),
+    }, index=pd.DatetimeIndex(times.astype('datetime64[ns]'), name='Datetime').tz_localize('UTC'))
+
+
+class FakeTicker:
+    def __init__(self, market, ticker):
+        self._market = market
+        self.ticker = ticker
+
+    def _check(self):
+        if self.ticker in self._market.failing:
+            raise ConnectionError(f'Simulated upstream failure for {self.ticker}')
+
+    @property
+    def info(self):
+        self._market.record('info')
+        self._check()
+        if self.ticker in self._market.empty:
+            return {}
+        return {
+            'shortName': f'{self.ticker} Holdings',
+            'longName': f'{self.ticker} Holdings Ltd.',
+            'exchange': exchange_timezone(self.ticker).split('/')[-1].upper(),
+            'currency': 'TWD' if '.TW' in self.ticker else 'USD',
+        }
+
+    def history(self, start=None, end=None, interval='1d', **kwargs):
+        self._market.record('history')
+        self._check()
+        df = self._market.window(self.ticker, start, end)
+        if df.empty:
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits'])
+        df = df.assign(**{'Dividends': 0.0, 'Stock Splits': 0.0})
+        df.index = df.index.tz_localize(exchange_timezone(self.ticker))
+        return df
+
+
+class FakeMarket:
+    def __init__(self, data_dir=None, latency=0.0, empty=(), failing=(), frozen=None):
+        self.data_dir = data_dir
+        self.latency = latency  # seconds added to every upstream call
+        self.empty = set(empty)  # tickers that behave like delisted / unknown symbols
+        self.failing = set(failing)  # tickers whose calls fail as in an outage
+        self.frozen = {ticker: pd.Timestamp(since) for ticker, since in (frozen or {}).items()}  # ticker -> first flat date
+        self.calls = Counter()
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, count=1):
+        # One simulated round trip per call, however many tickers it covers
+        with self._lock:
+            self.calls[kind] += 1
+            self.calls[f'{kind}_tickers'] += count
+        if self.latency:
+            time.sleep(self.latency)
+
+    def bars(self, ticker):
+        with self._lock:
+            df = self._bars.get(ticker)
+        if df is None:
+            path = os.path.join(self.data_dir, f'{ticker}.csv') if self.data_dir else None
+            if path and os.path.exists(path):
+                df = pd.read_csv(path, index_col='Date', parse_dates=True)
+            else:
+                df = synthetic_bars(ticker)
+            if ticker in self.frozen:
+                flat = df.index >= self.frozen[ticker]
+                df = df.copy()
+                df.loc[flat, ['Open', 'High', 'Low', 'Close']] = df['Close'][~flat].iloc[-1]
+            with self._lock:
+                self._bars[ticker] = df
+        return df
+
+    def window(self, ticker, start, end):
+        if ticker in self.empty or ticker in self.failing:
+            return pd.DataFrame()
+        df = self.bars(ticker)
+        start = pd.Timestamp(start) if start is not None else df.index[0]
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.now()
+        # Yahoo treats `end` as exclusive
+        return df[(df.index >= start.normalize()) & (df.index < end.normalize())]
+
+    def download(self, tickers, start=None, end=None, interval='1d', progress=False, **kwargs):
+        names = tickers.split() if isinstance(tickers, str) else list(tickers)
+        self.record('download', len(names))
+
+        intraday = interval in INTRADAY_MINUTES
+        if intraday:
+            frames = {ticker: pd.DataFrame() if ticker in self.empty | self.failing
+                      else synthetic_intraday_bars(ticker, interval, start, end)
+                      for ticker in names}
+        else:
+            frames = {ticker: self.window(ticker, start, end) for ticker in names}
+        if all(df.empty for df in frames.values()):
+            return pd.DataFrame()
+
+        # Failed symbols still show up as all-NaN columns in a multi-ticker result
+        template = next(df for df in frames.values() if not df.empty)
+        frames = {t: (df if not df.empty else template.iloc[:0]) for t, df in frames.items()}
+        df = pd.concat(frames, axis=1).swaplevel(0, 1, axis=1).sort_index(axis=1)
+        df.columns.names = ['Price', 'Ticker']
+        df.index.name = 'Datetime' if intraday else 'Date'
+        return df
+
+    def Ticker(self, ticker, session=None):
+        return FakeTicker(self, ticker)
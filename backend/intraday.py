@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+
+from providers import OHLCV_COLUMNS, get_provider
+
+# Intraday bars (5m / 15m / 1h) for /api/metals?interval=... They don't go through the
+# bar store: every (ticker, interval) gets a BarRing, a fixed-capacity ring buffer over
+# preallocated NumPy arrays, so memory stays at INTRADAY_RETENTION bars per series however
+# long the server runs. Rings fill incrementally: once a ring holds bars, a refresh only
+# asks upstream for bars from its newest one (which may still be forming) onwards.
+#
+# Bars are indexed by their open time in UTC, so COMEX and London series line up.
+INTRADAY_INTERVALS = {'5m': 5, '15m': 15, '1h': 60}  # minutes per bar
+# How far back Yahoo serves each interval
+INTRADAY_LOOKBACK_DAYS = {'5m': 59, '15m': 59, '1h': 729}
+# A cold ring is filled from as far back as its retention reaches in round-the-clock trading,
+# stretched over weekends, plus this many days for holidays. Shorter sessions (the London
+# ETFs) start partly filled and fill up as the server runs.
+COLD_FILL_MARGIN_DAYS = 4
+# Bars kept per ticker and interval, overridable per interval: INTRADAY_RETENTION="5m:4032,1h:2400".
+# The defaults are about a week, two weeks and ten weeks of round-the-clock futures trading.
+DEFAULT_RETENTION = {'5m': 2016, '15m': 1344, '1h': 1680}
+INTRADAY_RETENTION = os.environ.get('INTRADAY_RETENTION', '')
+# A series is refetched at most this often; requests in between are served from its ring
+INTRADAY_REFRESH_SECONDS = float(os.environ.get('INTRADAY_REFRESH_SECONDS', 60))
+
+
+def parse_retention(value):
+    retention = dict(DEFAULT_RETENTION)
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            interval, bars = item.split(':')
+            if interval not in INTRADAY_INTERVALS:
+                raise ValueError(f'Unknown intraday interval in INTRADAY_RETENTION: {interval}')
+            retention[interval] = int(bars)
+    return retention
+
+
+def utc_now():
+    return pd.Timestamp.now(tz='UTC').tz_localize(None)
+
+
+def cold_fill_start(interval, bars, now):
+    span = pd.Timedelta(minutes=bars * INTRADAY_INTERVALS[interval]) * 7 / 5 + pd.Timedelta(days=COLD_FILL_MARGIN_DAYS)
+    return max(now - span, now - pd.Timedelta(days=INTRADAY_LOOKBACK_DAYS[interval]))
+
+
+class BarRing:
+    """Fixed-capacity OHLCV bars in time order; once full, each new bar overwrites the oldest."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype='int64')  # bar open, ns since epoch (UTC)
+        self.values = np.full((capacity, len(OHLCV_COLUMNS)), np.nan)
+        self.head = 0  # slot of the oldest bar
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _slots(self, positions):
+        # Positions counted from the oldest bar -> array slots
+        return (self.head + positions) % self.capacity
+
+    def last_time(self):
+        if not self.size:
+            return None
+        return int(self.times[(self.head + self.size - 1) % self.capacity])
+
+    def append(self, df):
+        """Merge an OHLCV frame: newer bars are appended, bars already held are overwritten.
+
+        Returns the number of bars appended. Bars older than the newest one held that
+        aren't in the ring (before its start, or a gap filled in late) are ignored.
+        """
+        df = df.sort_index()
+        times = df.index.to_numpy().astype('datetime64[ns]').astype('int64')
+        values = df.reindex(columns=OHLCV_COLUMNS).to_numpy(dtype='float64')
+
+        last = self.last_time()
+        if last is not None:
+            split = np.searchsorted(times, last, side='right')
+            if split:
+                # Revisions of held bars, typically just the one that was still forming
+                held = self._slots(np.arange(self.size))
+                positions = np.searchsorted(self.times[held], times[:split])
+                found = positions < self.size
+                found[found] = self.times[held[positions[found]]] == times[:split][found]
+                self.values[held[positions[found]]] = values[:split][found]
+            times, values = times[split:], values[split:]
+
+        # More new bars than fit: only the newest `capacity` would survive anyway
+        times, values = times[-self.capacity:], values[-self.capacity:]
+        n = len(times)
+        if n:
+            slots = self._slots(self.size + np.arange(n))
+            self.times[slots] = times
+            self.values[slots] = values
+            overflow = max(0, self.size + n - self.capacity)
+            self.head = (self.head + overflow) % self.capacity
+            self.size = min(self.capacity, self.size + n)
+        return n
+
+    def frame(self):
+        # Oldest bar first, as a copy the ring can keep overwriting
+        slots = self._slots(np.arange(self.size))
+        return pd.DataFrame(self.values[slots], columns=OHLCV_COLUMNS,
+                            index=pd.DatetimeIndex(self.times[slots].astype('datetime64[ns]'), name='Date'))
+
+
+class IntradayStore:
+    # Ring per (ticker, interval), created at full capacity on first use. Callers decide
+    # which tickers may get one (the app only allows METAL_TICKERS), which bounds the total.
+    def __init__(self, retention=INTRADAY_RETENTION, refresh_seconds=INTRADAY_REFRESH_SECONDS):
+        self.retention = parse_retention(retention) if isinstance(retention, str) else dict(retention)
+        self.refresh_seconds = refresh_seconds
+        self._rings = {}  # (ticker, interval) -> BarRing
+        self._refreshed = {}  # (ticker, interval) -> monotonic time of the last refresh
+        # One lock per interval: concurrent requests for stale series wait for a single refresh
+        self._locks = {interval: threading.Lock() for interval in INTRADAY_INTERVALS}
+
+    def _ring(self, ticker, interval):
+        ring = self._rings.get((ticker, interval))
+        if ring is None:
+            ring = self._rings[(ticker, interval)] = BarRing(self.retention[interval])
+        return ring
+
+    def frames(self, tickers, interval):
+        """{ticker: OHLCV frame} of `interval` bars, refreshing series older than refresh_seconds."""
+        tickers = list(tickers)
+        with self._locks[interval]:
+            now = time.monotonic()
+            stale = [ticker for ticker in tickers
+                     if now - self._refreshed.get((ticker, interval), -np.inf) >= self.refresh_seconds]
+            if stale:
+                self.refresh(stale, interval)
+            return {ticker: self._ring(ticker, interval).frame() for ticker in tickers}
+
+    def refresh(self, tickers, interval):
+        # At most two batched downloads: cold rings from about as far back as they hold, warm
+        # ones from the oldest of their newest bars (overlap is merged, not duplicated)
+        now = utc_now()
+        cold_start = cold_fill_start(interval, self.retention[interval], now)
+        cold = [ticker for ticker in tickers if not len(self._ring(ticker, interval))]
+        warm = [ticker for ticker in tickers if ticker not in cold]
+        batches = []
+        if cold:
+            batches.append((cold, cold_start))
+        if warm:
+            oldest = min(self._ring(ticker, interval).last_time() for ticker in warm)
+            batches.append((warm, max(cold_start, pd.Timestamp(oldest))))
+
+        for batch, start in batches:
+            try:
+                # Timezone-aware start: yfinance reads naive datetimes as exchange-local time
+                frames = get_provider().download(batch, start.tz_localize('UTC').to_pydatetime(), None, interval=interval)
+            except Exception as e:
+                # Keep serving what the rings hold; the next request past refresh_seconds retries
+                print(f"Intraday {interval} refresh failed for {', '.join(batch)}: {e}")
+                frames = {}
+            for ticker in batch:
+                df = frames.get(ticker)
+                if df is not None and not df.empty:
+                    self._ring(ticker, interval).append(df)
+                self._refreshed[(ticker, interval)] = time.monotonic()
+
+    def status(self):
+        return {
+            f'{ticker} {interval}': {'bars': len(ring), 'capacity': ring.capacity,
+                                      'bytes': ring.times.nbytes + ring.values.nbytes}
+            for (ticker, interval), ring in list(self._rings.items())
+        }
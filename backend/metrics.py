@@ -0,0 +1,180 @@
+import time
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Minimal Prometheus text-format metrics (no prometheus_client dependency).
+# Under gunicorn every worker keeps and reports its own numbers.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        # collect() -> [(name, type, help, [(labels_dict, value), ...])], evaluated at scrape time
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    def __init__(self, name, help_text, registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{_format_labels(key + (("le", bound),))} {cumulative}')
+                lines.append(f'{self.name}_bucket{_format_labels(key + (("le", "+Inf"),))} {series[-1]}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(float(series[-2]))}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {series[-1]}')
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram('metals_http_request_seconds', 'Request handling time by endpoint and status.')
+RESPONSE_BYTES = Histogram('metals_response_bytes', 'Response body size by endpoint.', buckets=SIZE_BUCKETS)
+STAGE_SECONDS = Histogram('metals_stage_seconds', 'Time spent per processing stage of a request.')
+UPSTREAM_SECONDS = Histogram('metals_upstream_seconds', 'Upstream market data call latency, per ticker ("batch" for multi-ticker downloads).')
+UPSTREAM_ERRORS = Counter('metals_upstream_errors_total', 'Upstream calls that raised, per ticker (unregistered tickers as "other").')
+UPSTREAM_EMPTY = Counter('metals_upstream_empty_total', 'Upstream calls that returned no bars, per ticker (unregistered tickers as "other").')
+UPSTREAM_SKIPPED = Counter('metals_upstream_skipped_total', 'Upstream calls avoided by the negative cache or an open circuit breaker.')
+
+
+# Per-request stage accounting. Time for a stage is summed over the whole request (e.g.
+# every per-stock alignment) and observed once when the request ends.
+_current_stages = contextvars.ContextVar('metals_current_stages', default=None)
+
+
+def begin_stages(endpoint):
+    return _current_stages.set((endpoint, {}))
+
+
+def end_stages(token):
+    current = _current_stages.get()
+    try:
+        _current_stages.reset(token)
+    except ValueError:
+        # Token from another context (e.g. a generator resumed elsewhere): just clear it
+        _current_stages.set(None)
+    if current is None:
+        return
+    endpoint, totals = current
+    for name, seconds in totals.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=name)
+
+
+def current_stage_totals():
+    # {stage: seconds} accumulated so far by the current request / tracked block
+    current = _current_stages.get()
+    return dict(current[1]) if current is not None else {}
+
+
+@contextmanager
+def stage(name):
+    current = _current_stages.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if current is not None:
+            totals = current[1]
+            totals[name] = totals.get(name, 0.0) + time.perf_counter() - started
+
+
+@contextmanager
+def tracked_stages(endpoint):
+    # For work outside a request, e.g. the background metals snapshot build
+    token = begin_stages(endpoint)
+    try:
+        yield
+    finally:
+        end_stages(token)
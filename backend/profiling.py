@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import random
+import datetime
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+# Opt-in per-request profiling for diagnosing slow requests on the real deployment.
+#
+# A request is profiled when it carries PROFILE_HEADER set to PROFILE_TOKEN, or at random
+# with probability PROFILE_SAMPLE_RATE. Both are off unless configured. A profiled request
+# gets a sampling profiler: a background thread that records the stacks of the threads
+# working for that request every PROFILE_INTERVAL_MS -- the request thread, plus the fetch
+# pool / ASGI pool threads while they run something on its behalf -- so Yahoo downloads,
+# pandas and serialization all show up, each under its thread's name.
+#
+# Results go to PROFILE_DIR (shared by all workers) as collapsed stacks ("a;b;c 12" lines,
+# readable by flamegraph.pl and speedscope) plus a small JSON summary. The newest
+# PROFILE_KEEP are kept.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/metals-profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+# Sampled (not header-requested) profiles beyond this many at once are skipped
+PROFILE_MAX_ACTIVE = int(os.environ.get('PROFILE_MAX_ACTIVE', 4))
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9TZ]+-[\w.-]+-[0-9a-f]{6}$')
+
+_current = contextvars.ContextVar('current_profile', default=None)
+_active = threading.BoundedSemaphore(PROFILE_MAX_ACTIVE)
+
+
+def token_matches(value):
+    # Without a configured token, header-triggered profiling and the admin endpoints are off.
+    # Compared as bytes: compare_digest raises on non-ASCII str, which any caller can send.
+    return bool(PROFILE_TOKEN) and hmac.compare_digest((value or '').encode(), PROFILE_TOKEN.encode())
+
+
+def frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def thread_role(name):
+    # 'analyze-fetch_3' -> 'analyze-fetch': threads of one pool are merged in the output
+    return re.sub(r'_\d+$', '', name)
+
+
+class RequestProfile:
+    def __init__(self, endpoint, method, path, trigger, interval_ms=PROFILE_INTERVAL_MS):
+        started = datetime.datetime.now(datetime.timezone.utc)
+        self.id = f"{started.strftime('%Y%m%dT%H%M%SZ')}-{endpoint}-{os.urandom(3).hex()}"
+        self.summary = {
+            'id': self.id,
+            'endpoint': endpoint,
+            'method': method,
+            'path': path,
+            'trigger': trigger,
+            'started_at': started.isoformat(timespec='seconds'),
+            'interval_ms': interval_ms,
+        }
+        self.interval = interval_ms / 1000
+        self.threads = {}  # thread ident -> role, for the threads currently working for this request
+        self.request_thread = threading.get_ident()
+        self.threads[self.request_thread] = thread_role(threading.current_thread().name)
+        self.stacks = Counter()
+        self._started = time.perf_counter()
+        self._stop = threading.Event()
+        self._finished = False
+        self._sampler = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    @contextmanager
+    def attach(self):
+        # Count the calling thread as working for this request while the block runs
+        ident = threading.get_ident()
+        self.threads[ident] = thread_role(threading.current_thread().name)
+        try:
+            yield
+        finally:
+            self.threads.pop(ident, None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, role in list(self.threads.items()):
+                frame = frames.get(ident)
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if labels:
+                    self.stacks[';'.join([role, *reversed(labels)])] += 1
+
+    def finish(self, status=None, stages=None):
+        if self._finished:
+            return
+        self._finished = True
+        self._stop.set()
+        self._sampler.join()
+        if _current.get() is self:
+            _current.set(None)
+        if self.summary['trigger'] == 'sample':
+            _active.release()
+        self.summary.update({
+            'status': status,
+            'duration_ms': round((time.perf_counter() - self._started) * 1000, 3),
+            'samples': sum(self.stacks.values()),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in (stages or {}).items()},
+        })
+        save_profile(self)
+
+
+def start_profile(endpoint, method, path, header_token):
+    """Profile for this request if it asked for one or was sampled, else None."""
+    if token_matches(header_token):
+        trigger = 'header'
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE and _active.acquire(blocking=False):
+        trigger = 'sample'
+    else:
+        return None
+    profile = RequestProfile(endpoint, method, path, trigger)
+    _current.set(profile)
+    return profile.start()
+
+
+def detach_request_thread():
+    # For servers whose request thread also serves other requests (the ASGI event loop):
+    # only the work handed to pool threads is attributed to the profile from here on
+    profile = _current.get()
+    if profile is not None:
+        profile.threads.pop(profile.request_thread, None)
+
+
+def profiled(fn):
+    """Wrap `fn` for another thread so it is sampled as part of the current request's profile."""
+    profile = _current.get()
+    if profile is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with profile.attach():
+            return fn(*args, **kwargs)
+    return run
+
+
+def collapsed_stacks(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def speedscope(summary, collapsed):
+    # speedscope's "sampled" file format, weights in milliseconds
+    frames, frame_index, samples, weights = [], {}, [], []
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(' ')
+        sample = []
+        for label in stack.split(';'):
+            if label not in frame_index:
+                frame_index[label] = len(frames)
+                frames.append({'name': label})
+            sample.append(frame_index[label])
+        samples.append(sample)
+        weights.append(int(count) * summary['interval_ms'])
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': f"{summary['method']} {summary['path']} ({summary['id']})",
+        'exporter': 'metals-dashboard',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': summary['id'],
+            'unit': 'milliseconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def _write(path, text):
+    # Temp file + rename so a listing never sees half a profile
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def save_profile(profile):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        _write(os.path.join(PROFILE_DIR, profile.id + '.collapsed'), collapsed_stacks(profile.stacks))
+        _write(os.path.join(PROFILE_DIR, profile.id + '.json'), json.dumps(profile.summary))
+        prune_profiles()
+    except OSError as e:
+        print(f"Could not save profile {profile.id}: {e}")
+
+
+def prune_profiles(keep=PROFILE_KEEP):
+    for summary in list_profiles()[keep:]:
+        for suffix in ('.json', '.collapsed'):
+            try:
+                os.unlink(os.path.join(PROFILE_DIR, summary['id'] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    # Newest first (ids start with their UTC timestamp)
+    summaries = []
+    try:
+        names = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith('.json')), reverse=True)
+    except FileNotFoundError:
+        return summaries
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                summaries.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return summaries
+
+
+def load_profile(profile_id):
+    """(summary, collapsed stacks) of a saved profile, or None."""
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + '.json')) as f:
+            summary = json.load(f)
+        with open(os.path.join(PROFILE_DIR, profile_id + '.collapsed')) as f:
+            return summary, f.read()
+    except (FileNotFoundError, ValueError):
+        return None
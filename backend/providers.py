@@ -0,0 +1,401 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from metrics import UPSTREAM_SECONDS, UPSTREAM_ERRORS, UPSTREAM_EMPTY, UPSTREAM_SKIPPED
+from ticker_guard import TickerGuard, TickerUnavailable
+
+# Market data sources. Every upstream fetch in the app goes through get_provider(), so
+# batching, caching and instrumentation only need to happen in one place, and another
+# source (LME/TWSE CSV dumps, local files, ...) can be swapped in with set_provider().
+#
+# All providers return plain OHLCV frames: flat Open/High/Low/Close/Volume columns and a
+# tz-naive DatetimeIndex holding the exchange-local trading date -- or, for intraday
+# intervals (5m, 1h, ...), each bar's open time in UTC.
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+YAHOO_POOL_SIZE = int(os.environ.get('YAHOO_POOL_SIZE', 16))
+YAHOO_TIMEOUT = float(os.environ.get('YAHOO_TIMEOUT', 10))
+YAHOO_MAX_RETRIES = int(os.environ.get('YAHOO_MAX_RETRIES', 2))
+YAHOO_BACKOFF_SECONDS = float(os.environ.get('YAHOO_BACKOFF_SECONDS', 0.5))
+YAHOO_RATE_LIMIT = float(os.environ.get('YAHOO_RATE_LIMIT', 4))  # calls per second, 0 = unlimited
+YAHOO_RATE_BURST = int(os.environ.get('YAHOO_RATE_BURST', 8))
+# Tickers of one batched download that came back empty and are asked again on their own to
+# tell "no bars" from a failure (see YahooProvider.download); the rest follow their verdict
+YAHOO_EMPTY_RECHECKS = int(os.environ.get('YAHOO_EMPTY_RECHECKS', 4))
+
+
+# Tickers that get their own label on the upstream metrics: the metals and the named screener
+# universes, registered by the app. Any other ticker a request names is counted as 'other',
+# so user input can't grow the number of metric series.
+_labeled_tickers = set()
+
+
+def label_tickers(tickers):
+    _labeled_tickers.update(tickers)
+
+
+def ticker_label(ticker):
+    return ticker if ticker in _labeled_tickers else 'other'
+
+
+def is_intraday(interval):
+    # '5m', '1h', ... as opposed to '1d', '1wk', '1mo'
+    return interval.endswith(('m', 'h'))
+
+
+def normalize_ohlcv(df, utc=False):
+    # Flat OHLCV columns on a tz-naive index; tz-aware indexes keep their local trading date,
+    # or are converted to UTC for intraday bars from different exchanges
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name='Date'), dtype='float64')
+    df = df[[col for col in OHLCV_COLUMNS if col in df.columns]].copy()
+    index = pd.to_datetime(df.index)
+    if index.tz is not None:
+        index = (index.tz_convert('UTC') if utc else index).tz_localize(None)
+    df.index = index.rename('Date')
+    return df
+
+
+def split_by_ticker(df, tickers, utc=False):
+    # Split a batched yf.download result ((Price, Ticker) columns) into one OHLCV frame per ticker
+    frames = {}
+    if df is None or df.empty:
+        return frames
+
+    if not isinstance(df.columns, pd.MultiIndex):
+        # Older yfinance returns flat columns when only one ticker was requested
+        if len(tickers) == 1:
+            frames[tickers[0]] = normalize_ohlcv(df, utc)
+        return frames
+
+    level = df.columns.names.index('Ticker') if 'Ticker' in df.columns.names else 1
+    present = set(df.columns.get_level_values(level))
+    for ticker in tickers:
+        if ticker in present:
+            # The batch index is the union of all calendars (COMEX, London, ...), drop the other markets' days
+            frames[ticker] = normalize_ohlcv(df.xs(ticker, axis=1, level=level).dropna(how='all'), utc)
+    return frames
+
+
+class RateLimiter:
+    # Token bucket shared by every thread talking to the same upstream
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # Negative balance = we reserved a future token; wait for it outside the lock
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class MarketDataProvider:
+    name = 'base'
+
+    def download(self, tickers, start, end, interval='1d'):
+        """Bars for several tickers at once -> {ticker: OHLCV frame}.
+
+        A ticker without bars in the window gets an empty frame; one the upstream failed
+        for (or that was skipped) is left out, so callers know to ask again later.
+        """
+        raise NotImplementedError
+
+    def history(self, ticker, start, end, interval='1d'):
+        """Bars for a single ticker -> OHLCV frame (empty if unavailable)."""
+        frames = self.download([ticker], start, end, interval)
+        return frames.get(ticker, normalize_ohlcv(None))
+
+    def info(self, ticker):
+        """Display metadata -> {'name', 'exchange', 'currency'} (values may be None)."""
+        return {'name': None, 'exchange': None, 'currency': None}
+
+
+def make_http_session(pool_size=YAHOO_POOL_SIZE):
+    # One keep-alive session for all Yahoo traffic. yfinance prefers curl_cffi (which it
+    # depends on); its Session keeps a curl handle per thread, so sharing it is safe.
+    try:
+        from curl_cffi import requests as curl_requests
+        return curl_requests.Session(impersonate='chrome', timeout=YAHOO_TIMEOUT)
+    except ImportError:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+class YahooProvider(MarketDataProvider):
+    name = 'yahoo'
+
+    def __init__(self, client=None, session=None, retries=YAHOO_MAX_RETRIES, backoff=YAHOO_BACKOFF_SECONDS,
+                 rate_limiter=None, empty_rechecks=YAHOO_EMPTY_RECHECKS):
+        if client is None:
+            import yfinance
+            client = yfinance
+            session = session or make_http_session()
+        self.client = client  # the yfinance module, or anything with the same download/Ticker API
+        self.session = session
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiter = rate_limiter or RateLimiter(YAHOO_RATE_LIMIT, YAHOO_RATE_BURST)
+        self.empty_rechecks = empty_rechecks
+        # yfinance hides upstream errors by default: history() answers a network error with an
+        # empty frame, exactly like a window without bars, and download() only logs them. With
+        # exceptions on, "no data" raises YFTickerMissingError (an empty result, never retried)
+        # and anything else is retried and then reported, so the guard's breaker sees outages.
+        config = getattr(client, 'config', None)
+        if config is not None:
+            config.debug.hide_exceptions = False
+        exceptions = getattr(client, 'exceptions', None)
+        self.no_data_errors = (exceptions.YFTickerMissingError,) if exceptions is not None else ()
+
+    def _call(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except self.no_data_errors:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                # Exponential backoff with a little jitter so workers don't retry in lockstep
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                print(f"Yahoo call failed ({e}), retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def download(self, tickers, start, end, interval='1d'):
+        tickers = list(tickers)
+        df = self._call(self.client.download, tickers, start=start, end=end, interval=interval,
+                        progress=False, session=self.session)
+        frames = split_by_ticker(df, tickers, utc=is_intraday(interval))
+        # yf.download turns a ticker's error into empty columns and only logs it, so an empty
+        # ticker either has no bars in the window (holiday, delisted) or failed. Asking each one
+        # again would make a holiday window cost a call per ticker, so only the first few are,
+        # in parallel: the others are empty too if those all were, and failed (left out) if not
+        empty = [ticker for ticker in tickers if ticker not in frames or frames[ticker].empty]
+        checked = empty[:self.empty_rechecks]
+        failed = False
+        if checked:
+            with ThreadPoolExecutor(max_workers=len(checked)) as pool:
+                rechecks = list(pool.map(lambda ticker: self._recheck(ticker, start, end, interval), checked))
+            for ticker, recheck in zip(checked, rechecks):
+                if recheck is None:
+                    failed = True
+                    frames.pop(ticker, None)
+                else:
+                    frames[ticker] = recheck
+        for ticker in empty[len(checked):]:
+            if failed:
+                frames.pop(ticker, None)
+            else:
+                frames[ticker] = normalize_ohlcv(None)
+        return frames
+
+    def _recheck(self, ticker, start, end, interval):
+        # One empty ticker of a batch on its own: its bars (possibly none), or None if it failed
+        try:
+            return self.history(ticker, start, end, interval)
+        except Exception as e:
+            print(f"Yahoo download failed for {ticker}: {e}")
+            return None
+
+    def history(self, ticker, start, end, interval='1d'):
+        stock = self.client.Ticker(ticker, session=self.session)
+        try:
+            df = self._call(stock.history, start=start, end=end, interval=interval)
+        except self.no_data_errors:
+            return normalize_ohlcv(None)
+        return normalize_ohlcv(df, utc=is_intraday(interval))
+
+    def info(self, ticker):
+        stock = self.client.Ticker(ticker, session=self.session)
+        info = self._call(lambda: stock.info)
+        return {
+            # Prefer shortName, then longName
+            'name': info.get('shortName') or info.get('longName'),
+            'exchange': info.get('exchange'),
+            'currency': info.get('currency'),
+        }
+
+
+class CsvDirectoryProvider(MarketDataProvider):
+    # Local files: <directory>/<TICKER>.csv with Date,Open,High,Low,Close[,Volume] columns
+    name = 'csv'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def download(self, tickers, start, end, interval='1d'):
+        if interval != '1d':
+            return {}
+        frames = {}
+        for ticker in tickers:
+            path = os.path.join(self.directory, f'{ticker}.csv')
+            if not os.path.exists(path):
+                frames[ticker] = normalize_ohlcv(None)
+                continue
+            df = normalize_ohlcv(pd.read_csv(path, index_col=0, parse_dates=True))
+            # Same window semantics as Yahoo: start inclusive, end exclusive
+            frames[ticker] = df[(df.index >= pd.Timestamp(start).normalize()) & (df.index < pd.Timestamp(end).normalize())]
+        return frames
+
+
+class InstrumentedProvider(MarketDataProvider):
+    # Latency / error / empty-result metrics around whichever provider is configured
+    def __init__(self, inner):
+        self.inner = inner
+        self.name = inner.name
+
+    def _observe(self, call, tickers, fetch):
+        label = ticker_label(tickers[0]) if len(tickers) == 1 else 'batch'
+        started = time.perf_counter()
+        try:
+            return fetch()
+        except Exception:
+            for ticker in tickers:
+                UPSTREAM_ERRORS.inc(provider=self.name, call=call, ticker=ticker_label(ticker))
+            raise
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - started, provider=self.name, call=call, ticker=label)
+
+    def download(self, tickers, start, end, interval='1d'):
+        tickers = list(tickers)
+        frames = self._observe('download', tickers, lambda: self.inner.download(tickers, start, end, interval))
+        for ticker in tickers:
+            if ticker not in frames:
+                UPSTREAM_ERRORS.inc(provider=self.name, call='download', ticker=ticker_label(ticker))
+            elif frames[ticker].empty:
+                UPSTREAM_EMPTY.inc(provider=self.name, call='download', ticker=ticker_label(ticker))
+        return frames
+
+    def history(self, ticker, start, end, interval='1d'):
+        df = self._observe('history', [ticker], lambda: self.inner.history(ticker, start, end, interval))
+        if df.empty:
+            UPSTREAM_EMPTY.inc(provider=self.name, call='history', ticker=ticker_label(ticker))
+        return df
+
+    def info(self, ticker):
+        return self._observe('info', [ticker], lambda: self.inner.info(ticker))
+
+
+class GuardedProvider(MarketDataProvider):
+    # Negative cache, per-ticker circuit breaker and last good data (ticker_guard.py)
+    # in front of the instrumented provider, so skipped calls never reach the upstream metrics
+    def __init__(self, inner, guard=None):
+        self.inner = inner
+        self.name = inner.name
+        self.guard = guard or TickerGuard()
+
+    def _skip(self, call, ticker, start, end, interval):
+        # Reason a call for `ticker` shouldn't go upstream now, or None
+        if self.guard.is_empty(call, ticker, start, end, interval):
+            reason = 'negative_cache'
+        elif not self.guard.allow(ticker):
+            reason = 'circuit_open'
+        else:
+            return None
+        UPSTREAM_SKIPPED.inc(provider=self.name, ticker=ticker_label(ticker), reason=reason)
+        return reason
+
+    def download(self, tickers, start, end, interval='1d'):
+        # Tickers known to be empty come back empty; ones behind an open breaker are left
+        # out, like a failed ticker, and the bar store callers keep serving what they have
+        frames, wanted = {}, []
+        for ticker in tickers:
+            reason = self._skip('download', ticker, start, end, interval)
+            if reason == 'negative_cache':
+                frames[ticker] = normalize_ohlcv(None)
+            elif reason is None:
+                wanted.append(ticker)
+        if not wanted:
+            return frames
+        try:
+            frames.update(self.inner.download(wanted, start, end, interval))
+        except Exception:
+            for ticker in wanted:
+                self.guard.record_failure(ticker)
+            raise
+        for ticker in wanted:
+            df = frames.get(ticker)
+            if df is None:
+                # Failed upstream on its own while the rest of the batch came through
+                self.guard.record_failure(ticker)
+                continue
+            self.guard.record_success(ticker)
+            if df.empty:
+                self.guard.remember_empty('download', ticker, start, end, interval)
+        return frames
+
+    def history(self, ticker, start, end, interval='1d'):
+        reason = self._skip('history', ticker, start, end, interval)
+        if reason == 'negative_cache':
+            return normalize_ohlcv(None)
+        if reason == 'circuit_open':
+            df = self.guard.last_good(ticker, start, end, interval)
+            if df is None:
+                raise TickerUnavailable(
+                    f'{ticker} is failing upstream, retrying in {self.guard.retry_in(ticker):.0f}s')
+            return df
+
+        try:
+            df = self.inner.history(ticker, start, end, interval)
+        except Exception:
+            self.guard.record_failure(ticker)
+            raise
+        self.guard.record_success(ticker)
+        if df.empty:
+            self.guard.remember_empty('history', ticker, start, end, interval)
+        else:
+            self.guard.remember_good(ticker, interval, df)
+        return df
+
+    def info(self, ticker):
+        return self.inner.info(ticker)
+
+
+def create_provider(spec):
+    # MARKET_DATA_PROVIDER: 'yahoo' (default) or 'csv:<directory>'
+    kind, _, arg = spec.partition(':')
+    if kind == 'yahoo':
+        return YahooProvider()
+    if kind == 'csv':
+        return CsvDirectoryProvider(arg)
+    raise ValueError(f'Unknown market data provider: {spec}')
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = GuardedProvider(InstrumentedProvider(create_provider(os.environ.get('MARKET_DATA_PROVIDER', 'yahoo'))))
+    return _provider
+
+
+def set_provider(provider):
+    global _provider
+    _provider = GuardedProvider(InstrumentedProvider(provider))
@@ -0,0 +1,67 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from correlation import corr_with, lagged_corr_with
+
+# Named universes for /api/screener; callers can also send their own list of stock IDs
+SCREENER_UNIVERSES = {
+    # TWSE iron & steel sector (20xx)
+    'twse_steel': [
+        '2002.TW', '2006.TW', '2007.TW', '2008.TW', '2009.TW', '2010.TW', '2012.TW', '2013.TW',
+        '2014.TW', '2015.TW', '2017.TW', '2020.TW', '2022.TW', '2023.TW', '2024.TW', '2025.TW',
+        '2027.TW', '2028.TW', '2029.TW', '2030.TW', '2031.TW', '2032.TW', '2033.TW', '2034.TW',
+        '2038.TW',
+    ],
+    # US-listed miners and metal producers
+    'us_metals': [
+        'FCX', 'SCCO', 'NEM', 'AA', 'CENX', 'KALU', 'NUE', 'STLD', 'CLF', 'CMC', 'RS', 'BHP',
+        'RIO', 'VALE', 'TECK', 'MT', 'AEM', 'WPM', 'HL', 'PAAS', 'CDE', 'MP',
+    ],
+}
+
+SCREEN_FIELDS = ['correlation', 'beta', 'lag_correlation', 'best_lag', 'observations']
+
+
+def universe_version(tickers):
+    # Content hash of the (deduplicated, order-free) ticker list
+    return hashlib.sha1('\n'.join(sorted(set(tickers))).encode()).hexdigest()[:12]
+
+
+def screen(metal_close, closes, basis, max_lag):
+    """Correlation, beta and best lead/lag of every stock against one metal.
+
+    metal_close is a date-indexed Series, closes {ticker: Series}. Everything is put on
+    the metal's calendar; with basis='returns' a return needs both days present.
+    Returns a DataFrame indexed by ticker with SCREEN_FIELDS columns.
+    """
+    tickers = list(closes)
+    if not tickers or metal_close.empty:
+        return pd.DataFrame(columns=SCREEN_FIELDS, index=pd.Index(tickers, name='ticker'), dtype='float64')
+
+    metal_close = metal_close.sort_index()
+    panel = pd.concat(closes, axis=1).reindex(metal_close.index)
+    x = metal_close.to_numpy(dtype='float64')
+    values = panel.to_numpy(dtype='float64')
+    if basis == 'returns':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = x[1:] / x[:-1] - 1
+            values = values[1:] / values[:-1] - 1
+
+    corr, beta, counts = corr_with(x, values)
+    lags, lag_corr = lagged_corr_with(x, values, max_lag)
+
+    # Strongest lead/lag relationship by absolute correlation; all-NaN columns stay NaN
+    filled = np.where(np.isnan(lag_corr), -1.0, np.abs(lag_corr))
+    best = filled.argmax(axis=0)
+    columns = np.arange(len(tickers))
+    has_lag = ~np.isnan(lag_corr).all(axis=0)
+
+    return pd.DataFrame({
+        'correlation': corr,
+        'beta': beta,
+        'lag_correlation': np.where(has_lag, lag_corr[best, columns], np.nan),
+        'best_lag': np.where(has_lag, lags[best], np.nan),
+        'observations': counts,
+    }, index=pd.Index(tickers, name='ticker'))
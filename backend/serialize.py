@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# Response builders. Everything here works column-wise on NumPy arrays: dates are
+# formatted in one strftime call and values go through ndarray.tolist(), no iterrows.
+DATE_FORMAT = '%Y-%m-%d'
+# Intraday bars are stamped with their UTC open time
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def format_dates(index, date_format=DATE_FORMAT):
+    return pd.DatetimeIndex(index).strftime(date_format).tolist()
+
+
+def to_json_list(values):
+    # float array -> list, NaN becomes None so it serializes as null
+    arr = np.asarray(values, dtype='float64')
+    mask = np.isnan(arr)
+    if not mask.any():
+        return arr.tolist()
+    out = arr.astype(object)
+    out[mask] = None
+    return out.tolist()
+
+
+def round_significant(values, digits):
+    # Round to `digits` significant digits in one vectorized pass. Scaling by an exact
+    # power of ten on the integer side keeps results at their shortest float repr.
+    arr = np.asarray(values, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        magnitude = np.floor(np.log10(np.abs(arr)))
+    decimals = np.where(np.isfinite(magnitude), digits - 1 - magnitude, 0)
+    scale = 10.0 ** np.abs(decimals)
+    return np.where(
+        decimals >= 0,
+        np.round(arr * scale) / scale,
+        np.round(arr / scale) * scale,
+    )
+
+
+def round_frame(df, digits):
+    # Same frame with every value column rounded; None leaves it untouched
+    if digits is None or df.empty:
+        return df
+    return pd.DataFrame(round_significant(df.to_numpy(dtype='float64'), digits), index=df.index, columns=df.columns)
+
+
+def records(df, fields, date_key='date'):
+    # Row-of-dicts shape: [{date_key: 'YYYY-MM-DD', key: value, ...}], fields maps key -> column
+    keys = [date_key, *fields.keys()]
+    columns = [df[col].to_numpy(dtype='float64').tolist() for col in fields.values()]
+    return [dict(zip(keys, row)) for row in zip(format_dates(df.index), *columns)]
+
+
+def candle_records(df, date_format=DATE_FORMAT):
+    # ApexCharts candlestick shape: [{x: 'YYYY-MM-DD', y: [o, h, l, c]}], skipping bars without open/close
+    df = df[df['Open'].notna() & df['Close'].notna()]
+    ohlc = df[OHLC_COLUMNS].to_numpy(dtype='float64').tolist()
+    return [{'x': date, 'y': values} for date, values in zip(format_dates(df.index, date_format), ohlc)]
+
+
+def frame_columns(panel):
+    # Date-indexed frame -> {'dates': [...], 'prices': {column: [...]}}
+    return {
+        'dates': format_dates(panel.index),
+        'prices': {name: to_json_list(panel[name].to_numpy()) for name in panel.columns},
+    }
+
+
+def candle_columns(frames, date_format=DATE_FORMAT):
+    # {name: OHLC frame} -> {'dates': [...], 'series': {name: {open, high, low, close}}}
+    frames = {name: df[OHLC_COLUMNS] for name, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return {'dates': [], 'series': {}}
+
+    panel = pd.concat(frames, axis=1).sort_index()
+    series = {}
+    for name in frames:
+        values = panel[name].to_numpy(dtype='float64', copy=True)
+        # Same rule as candle_records: a bar without open/close is dropped entirely
+        values[np.isnan(values[:, 0]) | np.isnan(values[:, 3])] = np.nan
+        series[name] = {
+            field.lower(): to_json_list(values[:, i]) for i, field in enumerate(OHLC_COLUMNS)
+        }
+    return {'dates': format_dates(panel.index, date_format), 'series': series}
@@ -0,0 +1,105 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+# In-process cache for downloaded price series, keyed by (ticker, start, end, interval).
+# Entries expire after SERIES_CACHE_TTL seconds and the least recently used ones are
+# evicted once SERIES_CACHE_SIZE is reached.
+SERIES_CACHE_SIZE = int(os.environ.get('SERIES_CACHE_SIZE', 256))
+SERIES_CACHE_TTL = float(os.environ.get('SERIES_CACHE_TTL', 900))
+
+
+def series_version(df):
+    # Content hash of a date-indexed frame: a cache key that changes exactly when the data does
+    digest = hashlib.sha1(df.index.asi8.tobytes())
+    digest.update(df.to_numpy(dtype='float64').tobytes())
+    return digest.hexdigest()[:16]
+
+
+class _Flight:
+    # One in-progress load that concurrent callers for the same key wait on
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SeriesCache:
+    def __init__(self, max_entries=SERIES_CACHE_SIZE, ttl=SERIES_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_load(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Someone is already fetching this key: share their result instead of fetching again
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                # Empty results are not cached so a transient upstream failure isn't pinned for the TTL
+                if flight.error is None and not getattr(flight.value, 'empty', False):
+                    self._put(key, flight.value)
+            flight.done.set()
+
+        return flight.value
+
+    def _put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
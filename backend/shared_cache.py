@@ -0,0 +1,150 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from series_cache import SERIES_CACHE_TTL
+
+try:
+    import fcntl
+except ImportError:  # Windows dev setup: no cross-process locking, duplicate fetches are harmless
+    fcntl = None
+
+# Price series shared by every gunicorn worker on the host. Each entry is one .npy file
+# holding a (2, n + 1) int64 array: row 0 the dates (datetime64[ns]) and row 1 the float64
+# values, bit for bit, after a header column whose date is the series' frozen_since flag
+# (NaT if none; see ticker_guard.py), set by whoever loaded it. Workers np.load them with mmap_mode='r' and wrap the rows in
+# pandas without copying, so the data lives once in the page cache however many workers
+# read it. Writers publish through a temp file + os.replace, so readers see either the
+# old file or the new one, never a partial write; a reader that still maps a replaced
+# file keeps its (unlinked) copy until it lets go of it.
+#
+# The flag comes back as series.attrs['frozen_since'] (a Timestamp or None).
+SHARED_CACHE_FORMAT = 2  # bumped whenever the file layout changes, so old files are never read
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR', '/tmp/metals-shared-cache')
+SHARED_CACHE_TTL = float(os.environ.get('SHARED_CACHE_TTL', SERIES_CACHE_TTL))
+
+
+class SharedSeriesStore:
+    def __init__(self, directory=SHARED_CACHE_DIR, ttl=SHARED_CACHE_TTL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.ttl = ttl
+        self._lock = threading.Lock()  # counters only
+        self._last_sweep = time.time()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr((SHARED_CACHE_FORMAT, key)).encode()).hexdigest()[:32] + '.npy')
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _read(self, path):
+        try:
+            if os.stat(path).st_mtime + self.ttl < time.time():
+                return None
+            data = np.load(path, mmap_mode='r')
+        except (FileNotFoundError, ValueError):
+            return None
+        index = pd.DatetimeIndex(data[0, 1:].view('datetime64[ns]'), name='Date', copy=False)
+        series = pd.Series(data[1, 1:].view('float64'), index=index, copy=False)
+        frozen_since = data[0, :1].view('datetime64[ns]')[0]
+        series.attrs['frozen_since'] = None if np.isnat(frozen_since) else pd.Timestamp(frozen_since)
+        return series
+
+    def get_or_load(self, key, loader):
+        """Shared entry for `key`, or loader() published for everyone. Values come back unnamed."""
+        path = self._path(key)
+        series = self._read(path)
+        if series is not None:
+            self._count('hits')
+            return series
+
+        # One loader per key across all workers: the others block here, then read its file
+        with open(path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            series = self._read(path)
+            if series is not None:
+                self._count('coalesced')
+                return series
+
+            self._count('misses')
+            series = loader()
+            # Empty results are not shared so a transient upstream failure isn't pinned for the TTL
+            if series.empty:
+                return series
+            self.put(key, series)
+        # Hand back the mapped copy so this worker doesn't keep a private one
+        shared = self._read(path)
+        return shared if shared is not None else series
+
+    def put(self, key, series):
+        data = np.zeros((2, len(series) + 1), dtype='int64')
+        data[0, 0] = pd.Timestamp(series.attrs.get('frozen_since') or pd.NaT).as_unit('ns').value
+        data[0, 1:] = pd.DatetimeIndex(series.index).as_unit('ns').asi8
+        data[1, 1:] = series.to_numpy(dtype='float64').view('int64')
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        # Expired files are only removed well after expiry; anything still mapped stays valid
+        now = time.time()
+        if now - self._last_sweep < self.ttl:
+            return
+        self._last_sweep = now
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime + 2 * self.ttl < now:
+                    os.unlink(entry.path)
+                    removed += entry.name.endswith('.npy')
+            except FileNotFoundError:
+                continue
+        self._count('evictions', removed)
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        sizes = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith('.npy'):
+                    sizes.append(entry.stat().st_size)
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'size': len(sizes),
+                'bytes': sum(sizes),
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,91 @@
+import os
+import hashlib
+import threading
+import time
+import datetime
+
+from wire import ENCODINGS, compress
+
+# Background rebuild of the /api/metals payload. Requests are answered from the last
+# built snapshot (already serialized and compressed) instead of hitting Yahoo inline.
+#
+# The snapshot is rebuilt every METALS_REFRESH_SECONDS, and additionally right after
+# each of the METALS_REFRESH_CLOSES (UTC "HH:MM", comma separated). The defaults sit
+# just after the London close, the COMEX settlement and the CME Globex daily close.
+METALS_REFRESH_SECONDS = int(os.environ.get('METALS_REFRESH_SECONDS', 3600))
+METALS_REFRESH_CLOSES = os.environ.get('METALS_REFRESH_CLOSES', '16:45,18:45,22:15')
+
+
+def parse_closes(value):
+    closes = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            hour, minute = item.split(':')
+            closes.append((int(hour), int(minute)))
+    return closes
+
+
+class Snapshot:
+    def __init__(self, body, version=None):
+        self.body = body
+        # Data version the body was built from (a bar store token for /api/metals)
+        self.version = version
+        # Compressed once per build in every encoding we can serve
+        self.encoded = {encoding: compress(body, encoding) for encoding in ENCODINGS}
+        # Strong validator: same bytes <=> same ETag
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.built_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+class SnapshotScheduler:
+    def __init__(self, build, dumps, interval=METALS_REFRESH_SECONDS, closes=METALS_REFRESH_CLOSES):
+        self._build = build  # () -> (version, {variant: payload})
+        self._dumps = dumps  # payload -> str
+        self.interval = interval
+        self.closes = parse_closes(closes)
+        self._snapshots = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        # Started lazily from the first request so it runs inside each gunicorn worker, not the master
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metals-snapshot', daemon=True)
+                self._thread.start()
+
+    def get(self, variant, timeout=None):
+        self.start()
+        self._ready.wait(timeout)
+        return self._snapshots.get(variant)
+
+    def refresh(self):
+        version, payloads = self._build()
+        snapshots = {variant: Snapshot(self._dumps(payload).encode('utf-8'), version)
+                     for variant, payload in payloads.items()}
+        # Swap the whole dict at once so readers never see a half-updated set
+        self._snapshots = snapshots
+        self._ready.set()
+
+    def seconds_until_next_run(self, now=None):
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        candidates = [now + datetime.timedelta(seconds=self.interval)]
+        for hour, minute in self.closes:
+            run_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if run_at <= now:
+                run_at += datetime.timedelta(days=1)
+            candidates.append(run_at)
+        return max(1.0, (min(candidates) - now).total_seconds())
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Metals snapshot refresh failed: {e}")
+            finally:
+                # Don't leave the first requests hanging if the very first build failed
+                self._ready.set()
+            time.sleep(self.seconds_until_next_run())
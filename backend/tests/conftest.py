@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend is a flat set of modules run from backend/, so tests import them the same way.
+# Every on-disk store goes to a throwaway directory and the background snapshot refresh
+# stays idle; both must be set before app is imported.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_scratch = tempfile.mkdtemp(prefix='metals-tests-')
+os.environ['BAR_STORE_DIR'] = os.path.join(_scratch, 'bars')
+os.environ['SHARED_CACHE_DIR'] = os.path.join(_scratch, 'shared')
+os.environ['PROFILE_DIR'] = os.path.join(_scratch, 'profiles')
+os.environ['METALS_REFRESH_SECONDS'] = '86400'
+os.environ['METALS_REFRESH_CLOSES'] = ''
+
+from bar_store import BarStore  # noqa: E402
+from fake_market import FakeMarket  # noqa: E402
+from providers import YahooProvider, RateLimiter, set_provider  # noqa: E402
+
+
+@pytest.fixture
+def market():
+    # Real Yahoo provider code path (batch split, normalization, guard) on the offline fake
+    market = FakeMarket()
+    set_provider(YahooProvider(client=market, rate_limiter=RateLimiter(0, 0), retries=0))
+    return market
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BarStore(str(tmp_path / 'bars'))
+
+
+@pytest.fixture
+def backend(market, store, monkeypatch):
+    """The app module on a fresh bar store, empty caches and the fake market."""
+    import app
+    from snapshot import SnapshotScheduler
+
+    monkeypatch.setattr(app, 'bar_store', store)
+    monkeypatch.setattr(app, 'metals_frames', {})
+    monkeypatch.setattr(app, 'metals_version', None)
+    monkeypatch.setattr(app, 'metals_snapshot', SnapshotScheduler(app.build_metals_snapshot, app.dump_metals_snapshot))
+    for cache in (app.series_cache, app.shared_series, app.candle_cache, app.screen_cache):
+        cache.clear()
+    return app
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
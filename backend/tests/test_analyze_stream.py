@@ -0,0 +1,36 @@
+import json
+import time
+import threading
+
+ANALYZE = {'stock_ids': ['1605.TW', 'NIKL', 'FCX'], 'metal': 'Nickel',
+           'start_date': '2023-01-01', 'end_date': '2024-01-01'}
+
+
+def test_streamed_pairs_match_the_batch_response(backend, client, monkeypatch):
+    # The first stock lands last, so pairs complete in the reverse of stock_ids order
+    download = backend.download_stock_close
+    landed = {ticker: threading.Event() for ticker in ANALYZE['stock_ids']}
+    after = {'1605.TW': 'NIKL', 'NIKL': 'FCX'}
+
+    def slow_download(ticker, start_date, end_date):
+        if ticker in after:
+            landed[after[ticker]].wait(5)
+            time.sleep(0.1)
+        try:
+            return download(ticker, start_date, end_date)
+        finally:
+            landed[ticker].set()
+    monkeypatch.setattr(backend, 'download_stock_close', slow_download)
+
+    events = [json.loads(line) for line in
+              client.post('/api/analyze', json={**ANALYZE, 'stream': 'ndjson'}).get_data(as_text=True).splitlines()]
+    assert [event['stock_id'] for event in events if event['type'] == 'stock_result'] == ['FCX', 'NIKL', '1605.TW']
+    streamed = {(event['stock1'], event['stock2']): event['correlation']
+                for event in events if event['type'] == 'stock_vs_stock'}
+
+    backend.series_cache.clear()
+    batch = client.post('/api/analyze', json=ANALYZE).get_json()['stock_vs_stock']
+    assert list(streamed) == [('NIKL', 'FCX'), ('1605.TW', 'FCX'), ('1605.TW', 'NIKL')]
+    assert set(streamed) == {(pair['stock1'], pair['stock2']) for pair in batch}
+    for pair in batch:
+        assert abs(streamed[(pair['stock1'], pair['stock2'])] - pair['correlation']) < 1e-12
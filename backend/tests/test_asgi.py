@@ -0,0 +1,89 @@
+import gzip
+import json
+import asyncio
+import threading
+
+import pytest
+
+
+def without_names(body):
+    # Display names resolve in the background, so they may differ between two calls
+    for entry in body['stock_results']:
+        entry.pop('stock_name')
+    return body
+
+
+ANALYZE = {'stock_ids': ['1605.TW', 'NIKL', 'FCX'], 'metal': 'Nickel',
+           'start_date': '2023-01-01', 'end_date': '2024-01-01'}
+
+
+async def call(asgi, method, path, body=None, headers=()):
+    # Minimal ASGI server: one request, the whole body at once
+    raw = json.dumps(body).encode() if body is not None else b''
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'headers': [(b'host', b'test'), (b'content-type', b'application/json'),
+                    *((name.encode(), value.encode()) for name, value in headers)],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('test', 80), 'client': ('127.0.0.1', 1),
+    }
+    received = []
+
+    async def receive():
+        if not received:
+            received.append(True)
+            return {'type': 'http.request', 'body': raw, 'more_body': False}
+        await asyncio.sleep(3600)
+
+    out = {'chunks': []}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            out['status'] = message['status']
+            out['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+        else:
+            out['chunks'].append(message['body'])
+
+    await asgi.app(scope, receive, send)
+    out['body'] = b''.join(out['chunks'])
+    return out
+
+
+@pytest.fixture
+def asgi(backend):
+    import asgi
+    return asgi
+
+
+def test_async_analyze_matches_wsgi(asgi, client):
+    expected = client.post('/api/analyze', json=ANALYZE).get_json()
+    response = asyncio.run(call(asgi, 'POST', '/api/analyze', ANALYZE))
+    assert response['status'] == 200
+    assert without_names(json.loads(response['body'])) == without_names(expected)
+
+
+def test_after_request_hooks_run_off_the_event_loop(asgi, monkeypatch):
+    threads = []
+    finalize = asgi.flask_app.finalize_request
+
+    def recording_finalize(rv, *args, **kwargs):
+        threads.append(threading.get_ident())
+        return finalize(rv, *args, **kwargs)
+    monkeypatch.setattr(asgi.flask_app, 'finalize_request', recording_finalize)
+
+    async def main():
+        loop_thread = threading.get_ident()
+        response = await call(asgi, 'POST', '/api/analyze', ANALYZE, [('accept-encoding', 'gzip')])
+        return loop_thread, response
+
+    loop_thread, response = asyncio.run(main())
+    assert response['status'] == 200
+    assert response['headers']['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response['body']))['stock_results']
+    assert threads and loop_thread not in threads
+
+
+def test_async_errors_still_answer(asgi):
+    response = asyncio.run(call(asgi, 'POST', '/api/analyze', {'metal': 'Nickel'}))
+    assert response['status'] == 400
+    assert json.loads(response['body']) == {'error': 'Missing stock_ids'}
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from bar_store import OHLCV_COLUMNS
+
+
+def bars(dates, close=100.0):
+    index = pd.DatetimeIndex(pd.to_datetime(dates), name='Date')
+    return pd.DataFrame({col: close for col in OHLCV_COLUMNS}, index=index, dtype='float64')
+
+
+def test_merge_bumps_revision_only_for_changed_bars(store):
+    store.merge('GC=F', bars(['2024-01-02', '2024-01-03', '2024-01-04']), '2024-01-01', '2024-01-05')
+    first = store.revision(['GC=F'])
+    assert first > 0
+
+    # Re-downloading the same bars changes nothing
+    store.merge('GC=F', bars(['2024-01-03', '2024-01-04']), '2024-01-03', '2024-01-05')
+    assert store.revision(['GC=F']) == first
+    assert store.load('GC=F', revised_after=first).empty
+
+    # A settlement revision and a new bar are all a poll after `first` sees
+    revised = bars(['2024-01-04', '2024-01-05'])
+    revised.loc[pd.Timestamp('2024-01-04'), 'Close'] = 101.0
+    store.merge('GC=F', revised, '2024-01-04', '2024-01-06')
+    assert store.revision(['GC=F']) > first
+    changed = store.load('GC=F', revised_after=first)
+    assert list(changed.index.strftime('%Y-%m-%d')) == ['2024-01-04', '2024-01-05']
+    assert changed['Close'].tolist() == [101.0, 100.0]
+
+
+def test_revision_is_per_ticker_set(store):
+    store.merge('GC=F', bars(['2024-01-02']), '2024-01-01', '2024-01-03')
+    gold = store.revision(['GC=F'])
+    store.merge('SI=F', bars(['2024-01-02']), '2024-01-01', '2024-01-03')
+    assert store.revision(['GC=F']) == gold
+    assert store.revision(['GC=F', 'SI=F']) > gold
+    assert store.revision(['HG=F']) == 0
+
+
+def test_store_id_survives_reopening(store):
+    from bar_store import BarStore
+    reopened = BarStore(store.path.rsplit('/', 1)[0])
+    assert reopened.store_id == store.store_id
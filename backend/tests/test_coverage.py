@@ -0,0 +1,105 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from bar_store import REFRESH_OVERLAP_DAYS, subtract_ranges
+
+
+def ts(value):
+    return pd.Timestamp(value)
+
+
+def test_subtract_ranges():
+    ranges = [(ts('2021-01-01'), ts('2021-04-01')), (ts('2022-01-01'), ts('2022-07-01'))]
+    assert subtract_ranges(ts('2021-02-01'), ts('2021-03-01'), ranges) == []
+    assert subtract_ranges(ts('2020-06-01'), ts('2023-01-01'), ranges) == [
+        (ts('2020-06-01'), ts('2021-01-01')),
+        (ts('2021-04-01'), ts('2022-01-01')),
+        (ts('2022-07-01'), ts('2023-01-01')),
+    ]
+    assert subtract_ranges(ts('2021-03-01'), ts('2022-02-01'), ranges) == [(ts('2021-04-01'), ts('2022-01-01'))]
+
+
+def test_non_overlapping_windows_are_tracked_separately(store):
+    store.merge('FCX', None, '2022-01-01', '2022-07-01')
+    store.merge('FCX', None, '2021-01-01', '2021-04-01')
+    assert store.missing_ranges('FCX', '2021-01-01', '2023-01-01') == [
+        (ts('2021-04-01'), ts('2022-01-01')),
+        (ts('2022-07-01'), ts('2023-01-01')),
+    ]
+
+    # Backfilling the gap folds all three into one range
+    store.merge('FCX', None, '2021-04-01', '2022-01-01')
+    assert store.covered_ranges('FCX') == [(ts('2021-01-01'), ts('2022-07-01'))]
+    assert store.missing_ranges('FCX', '2021-01-01', '2022-07-01') == []
+
+
+def test_recent_days_stay_uncovered(store):
+    today = pd.Timestamp(datetime.date.today())
+    store.merge('GC=F', None, today - pd.Timedelta(days=30), datetime.datetime.now())
+    settled = today - pd.Timedelta(days=REFRESH_OVERLAP_DAYS)
+    # An end with a time of day includes that day
+    assert store.missing_ranges('GC=F', today - pd.Timedelta(days=30), datetime.datetime.now()) == [
+        (settled, today + pd.Timedelta(days=1))]
+
+
+@pytest.fixture
+def downloads(market, monkeypatch):
+    # (tickers, start, end) of every download that reaches the fake upstream
+    calls = []
+    original = market.download
+
+    def download(tickers, start=None, end=None, **kwargs):
+        calls.append((tuple(tickers), ts(start), ts(end)))
+        return original(tickers, start=start, end=end, **kwargs)
+    monkeypatch.setattr(market, 'download', download)
+    return calls
+
+
+def assert_complete(backend, market, ticker, start, end):
+    loaded = backend.load_daily_bars([ticker], start, end)[ticker]
+    expected = market.window(ticker, start, end)
+    pd.testing.assert_index_equal(loaded.index, expected.index, check_names=False)
+
+
+def test_backfilled_window_has_no_gaps(backend, market, downloads):
+    # The export sequence from the bug report: a window, an older one, then both and more
+    assert_complete(backend, market, 'FCX', '2022-01-01', '2022-06-30')
+    assert_complete(backend, market, 'FCX', '2021-01-01', '2021-03-31')
+    downloads.clear()
+    assert_complete(backend, market, 'FCX', '2021-01-01', '2023-01-01')
+    assert downloads == [
+        (('FCX',), ts('2021-03-31'), ts('2022-01-01')),
+        (('FCX',), ts('2022-06-30'), ts('2023-01-01')),
+    ]
+
+
+def test_covered_window_skips_upstream(backend, market, downloads):
+    assert_complete(backend, market, 'NEM', '2020-01-01', '2021-01-01')
+    assert len(downloads) == 1
+    # Same window and any past window inside it: served from the store alone
+    assert_complete(backend, market, 'NEM', '2020-01-01', '2021-01-01')
+    assert_complete(backend, market, 'NEM', '2020-03-01', '2020-06-01')
+    assert len(downloads) == 1
+
+
+def test_failed_ticker_is_not_marked_covered(backend, market, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError('upstream down')
+    monkeypatch.setattr(market, 'download', fail)
+    backend.load_daily_bars(['AA'], '2020-01-01', '2021-01-01')
+    assert backend.bar_store.covered_ranges('AA') == []
+
+
+def test_export_end_date_is_exclusive_cold_and_warm(backend, client):
+    def last_row(start_date, end_date):
+        query = {'metals': ['Gold'], 'stock_ids': ['FCX'], 'format': 'csv', 'start_date': start_date, 'end_date': end_date}
+        lines = client.post('/api/export', json=query).get_data(as_text=True).strip().splitlines()
+        return lines[-1].split(',')[0]
+
+    cold = last_row('2024-01-02', '2024-01-10')
+    assert cold == '2024-01-09'
+    # Once a wider window has filled the store, the same request is answered the same way
+    last_row('2023-12-01', '2024-02-01')
+    assert last_row('2024-01-02', '2024-01-10') == cold
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import downsample_frame, lttb_indices, ohlc_buckets
+
+
+def frame(n_rows, n_cols, seed=0, gaps=0.0):
+    rng = np.random.default_rng(seed)
+    values = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_rows, n_cols)), axis=0))
+    values[rng.random(values.shape) < gaps] = np.nan
+    return pd.DataFrame(values, index=pd.bdate_range('2020-01-01', periods=n_rows),
+                        columns=[f's{i}' for i in range(n_cols)])
+
+
+@pytest.mark.parametrize('n_cols, max_points, gaps', [(1, 200, 0), (3, 200, 0), (21, 200, 0.05), (21, 10, 0.3), (5, 3, 0)])
+def test_downsample_frame_stays_within_budget(n_cols, max_points, gaps):
+    df = frame(780, n_cols, gaps=gaps)
+    out = downsample_frame(df, max_points)
+    assert len(out) <= max_points
+    assert out.index[0] == df.index[0] and out.index[-1] == df.index[-1]
+    assert out.index.is_monotonic_increasing and out.index.is_unique
+
+
+def test_downsample_frame_keeps_a_spike_in_any_series():
+    df = frame(1000, 4)
+    df.iloc[537, 2] *= 3
+    assert df.index[537] in downsample_frame(df, 100).index
+
+
+def test_small_frames_are_untouched():
+    df = frame(50, 3)
+    assert downsample_frame(df, 200) is df
+    assert downsample_frame(df, None) is df
+
+
+def test_lttb_indices():
+    x = np.arange(1000, dtype='float64')
+    y = np.sin(x / 50) + (x == 400) * 5
+    idx = lttb_indices(x, y, 60)
+    assert len(idx) == 60
+    assert idx[0] == 0 and idx[-1] == 999
+    assert np.all(np.diff(idx) > 0)
+    assert 400 in idx
+    assert list(lttb_indices(x[:5], y[:5], 10)) == [0, 1, 2, 3, 4]
+
+
+def test_ohlc_buckets_budget():
+    df = frame(500, 1)['s0'].to_frame('Close').assign(Open=lambda d: d['Close'], High=lambda d: d['Close'] + 1,
+                                                     Low=lambda d: d['Close'] - 1)
+    out = ohlc_buckets({'s0': df}, 40)['s0']
+    assert len(out) == 40
+    assert out['High'].max() == df['High'].max() and out['Low'].min() == df['Low'].min()
+
+
+def test_ohlc_buckets_share_one_date_axis():
+    # Different calendars (e.g. TWSE vs COMEX holidays): buckets are cut on the union of dates
+    base = frame(300, 1)['s0'].to_frame('Close').assign(Open=lambda d: d['Close'], High=lambda d: d['Close'] + 1,
+                                                       Low=lambda d: d['Close'] - 1)
+    frames = {'a': base.iloc[::2], 'b': base.iloc[1::3], 'c': base.iloc[:100]}
+    out = ohlc_buckets(frames, 50)
+    dates = pd.concat(out.values()).index.unique()
+    assert len(dates) <= 50
+    for name, df in frames.items():
+        assert out[name]['High'].max() == df['High'].max() and out[name]['Low'].min() == df['Low'].min()
+        assert out[name]['Open'].iloc[0] == df['Open'].iloc[0] and out[name]['Close'].iloc[-1] == df['Close'].iloc[-1]
+
+
+def test_columnar_metals_within_max_points(client):
+    body = client.get('/api/metals?max_points=50&format=columnar').get_json()
+    assert 0 < len(body['dates']) <= 50
+    for series in body['series'].values():
+        assert len(series['close']) == len(body['dates'])
+
+
+@pytest.mark.parametrize('interval, offset', [('1wk', pd.offsets.Week(weekday=0)), ('1mo', pd.offsets.MonthBegin())])
+def test_resampled_candles_share_period_labels(client, interval, offset):
+    body = client.get(f'/api/metals?interval={interval}&format=columnar').get_json()
+    dates = pd.to_datetime(body['dates'])
+    assert dates.is_unique
+    assert all(offset.is_on_offset(date) for date in dates)
+    # Every series trades most periods, so no date is a one-series stray
+    for series in body['series'].values():
+        assert sum(value is not None for value in series['close']) >= 0.9 * len(dates)
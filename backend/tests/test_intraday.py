@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from intraday import (BarRing, IntradayStore, DEFAULT_RETENTION, INTRADAY_INTERVALS, INTRADAY_LOOKBACK_DAYS,
+                      parse_retention, utc_now)
+from providers import OHLCV_COLUMNS
+
+
+def minute_bars(minutes, seed=0):
+    values = np.random.default_rng(seed).random((len(minutes), len(OHLCV_COLUMNS)))
+    index = pd.DatetimeIndex(np.asarray(minutes, dtype='int64') * 60 * 10**9, name='Date')
+    return pd.DataFrame(values, index=index, columns=OHLCV_COLUMNS)
+
+
+def held_minutes(ring):
+    return (ring.frame().index.asi8 // (60 * 10**9)).tolist()
+
+
+def test_ring_wraps_and_keeps_newest_bars():
+    ring = BarRing(5)
+    assert ring.append(minute_bars(range(3))) == 3
+    assert held_minutes(ring) == [0, 1, 2]
+    # Six new bars for five slots: the oldest of them would be overwritten at once
+    assert ring.append(minute_bars(range(3, 9))) == 5
+    assert len(ring) == 5
+    assert held_minutes(ring) == [4, 5, 6, 7, 8]
+    assert ring.times.shape == (5,) and ring.values.shape == (5, 5)
+
+
+def test_ring_overwrites_held_bars_in_place():
+    ring = BarRing(4)
+    ring.append(minute_bars(range(6)))  # wrapped: holds 2..5
+    revised = minute_bars([4, 5, 6], seed=1)
+    assert ring.append(revised) == 1
+    assert held_minutes(ring) == [3, 4, 5, 6]
+    np.testing.assert_array_equal(ring.frame().loc[revised.index].to_numpy(), revised.to_numpy())
+
+
+def test_ring_ignores_old_bars_it_does_not_hold():
+    ring = BarRing(3)
+    ring.append(minute_bars([10, 11, 12]))
+    before = ring.frame()
+    assert ring.append(minute_bars([1, 2, 3], seed=2)) == 0
+    pd.testing.assert_frame_equal(ring.frame(), before)
+
+
+def test_ring_matches_reference_model():
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        capacity = int(rng.integers(1, 30))
+        ring, reference, last = BarRing(capacity), {}, 0
+        for step in range(20):
+            # Each refresh overlaps the tail a little and runs up to ~3 rings ahead, unsorted
+            lo, hi = max(0, last - int(rng.integers(0, 5))), last + int(rng.integers(1, 3 * capacity))
+            df = minute_bars(range(lo, hi), seed=step)
+            ring.append(df.sample(frac=1, random_state=step))
+            newest = max(reference, default=-1)
+            for minute, row in zip(range(lo, hi), df.to_numpy()):
+                if minute > newest or minute in reference:
+                    reference[minute] = row
+            reference = {minute: reference[minute] for minute in sorted(reference)[-capacity:]}
+            last = hi
+
+            assert held_minutes(ring) == list(reference)
+            np.testing.assert_array_equal(ring.frame().to_numpy(), np.array(list(reference.values())))
+
+
+def test_parse_retention():
+    retention = parse_retention('5m:100, 1h:20')
+    assert retention['5m'] == 100 and retention['1h'] == 20 and retention['15m'] == 1344
+
+
+@pytest.fixture
+def downloads(market, monkeypatch):
+    starts = []
+    original = market.download
+
+    def download(tickers, start=None, end=None, interval='1d', **kwargs):
+        starts.append(pd.Timestamp(start).tz_convert('UTC').tz_localize(None))
+        return original(tickers, start=start, end=end, interval=interval, **kwargs)
+    monkeypatch.setattr(market, 'download', download)
+    return starts
+
+
+@pytest.mark.parametrize('interval', ['5m', '15m', '1h'])
+def test_cold_fill_is_sized_to_retention(downloads, interval):
+    store = IntradayStore(retention=DEFAULT_RETENTION, refresh_seconds=0)
+    frames = store.frames(['GC=F'], interval)
+    span = utc_now() - downloads[0]
+    assert span <= pd.Timedelta(days=INTRADAY_LOOKBACK_DAYS[interval])
+    # No more than retention's worth of time (weekends and a few holidays aside)...
+    assert span <= pd.Timedelta(minutes=DEFAULT_RETENTION[interval] * INTRADAY_INTERVALS[interval]) * 7 / 5 + pd.Timedelta(days=5)
+    # ...which still fills the ring for round-the-clock weekday trading
+    assert len(frames['GC=F']) == DEFAULT_RETENTION[interval]
+
+
+def test_warm_refresh_fetches_from_the_newest_bar(downloads):
+    store = IntradayStore(retention={'5m': 100, '15m': 100, '1h': 100}, refresh_seconds=0)
+    newest = store.frames(['GC=F', 'SI=F'], '5m')['GC=F'].index[-1]
+    store.frames(['GC=F', 'SI=F'], '5m')
+    assert len(downloads) == 2
+    assert downloads[1] == newest
+
+
+def test_intraday_metals_endpoint(client):
+    body = client.get('/api/metals/Gold?interval=1h&format=columnar').get_json()
+    assert body['dates'][0].endswith('Z') and 'T' in body['dates'][0]
+    assert len(body['dates']) == DEFAULT_RETENTION['1h']
+    assert client.get('/api/metals/DJUSST?interval=1h').status_code == 400
+    assert client.post('/api/analyze', json={'stock_ids': ['FCX'], 'metal': 'Gold', 'interval': '5m'}).status_code == 400
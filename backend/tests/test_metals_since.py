@@ -0,0 +1,47 @@
+import pandas as pd
+
+TOKEN_HEADER = 'X-Metals-Token'
+
+
+def test_since_token_returns_only_new_and_revised_bars(backend, client):
+    response = client.get('/api/metals/Gold')
+    assert response.status_code == 200
+    token = response.headers[TOKEN_HEADER]
+    assert token.startswith(backend.bar_store.store_id + '.')
+
+    # Up to date: nothing to send
+    body = client.get(f'/api/metals/Gold?since={token}').get_json()
+    assert body['full'] is False and body['bars'] == {}
+    token = body['token']
+
+    # Revise the last stored Gold bar: exactly that bar comes back, with a newer token
+    last = backend.bar_store.load('GC=F').tail(1)
+    last['Close'] += 1
+    backend.bar_store.merge('GC=F', last, last.index[0], last.index[0] + pd.Timedelta(days=1))
+    body = client.get(f'/api/metals/Gold?since={token}').get_json()
+    assert body['full'] is False
+    assert body['token'] != token
+    assert [bar['x'] for bar in body['bars']['Gold']] == [last.index[0].strftime('%Y-%m-%d')]
+    assert body['bars']['Gold'][0]['y'][3] == last['Close'].iloc[0]
+
+    # Polling with the new token is quiet again
+    assert client.get(f"/api/metals/Gold?since={body['token']}").get_json()['bars'] == {}
+
+
+def test_foreign_token_gets_full_history(backend, client):
+    client.get('/api/metals/Silver')
+    body = client.get('/api/metals/Silver?since=deadbeef0000.5').get_json()
+    assert body['full'] is True
+    assert len(body['bars']['Silver']) == len(backend.bar_store.load('SI=F', pd.Timestamp.now() - pd.Timedelta(days=1095)))
+
+
+def test_since_date_and_invalid_combinations(client):
+    client.get('/api/metals/Copper')
+    since = (pd.Timestamp.now() - pd.Timedelta(days=30)).strftime('%Y-%m-%d')
+    body = client.get(f'/api/metals/Copper?since={since}').get_json()
+    assert body['bars']['Copper']
+    assert all(bar['x'] >= since for bar in body['bars']['Copper'])
+
+    assert client.get('/api/metals?since=not-a-token').status_code == 400
+    assert client.get(f'/api/metals?since={since}&max_points=50').status_code == 400
+    assert client.get('/api/metals/Unobtainium').status_code == 404
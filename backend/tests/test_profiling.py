@@ -0,0 +1,21 @@
+import profiling
+from profiling import PROFILE_HEADER, token_matches
+
+
+def test_token_matches(monkeypatch):
+    assert not token_matches('secret')  # no token configured
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    assert token_matches('secret')
+    assert not token_matches(None)
+    assert not token_matches('secreT')
+    # Non-ASCII input is a mismatch, not a TypeError
+    assert not token_matches('sécret')
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'sécret')
+    assert token_matches('sécret')
+
+
+def test_non_ascii_token_header_is_not_found(client, monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_TOKEN', 'secret')
+    response = client.get('/api/admin/profiles', headers={PROFILE_HEADER: 'sécret'})
+    assert response.status_code == 404
+    assert client.get('/api/admin/profiles', headers={PROFILE_HEADER: 'secret'}).status_code == 200
@@ -0,0 +1,183 @@
+import os
+import time
+
+import pytest
+
+from bar_store import BarStore
+from fake_market import FakeMarket
+from providers import YAHOO_EMPTY_RECHECKS, YahooProvider, RateLimiter, get_provider, set_provider
+from ticker_guard import TickerUnavailable, flat_run, frozen_since
+
+START, END = '2024-01-01', '2024-03-01'
+
+
+@pytest.fixture
+def outage():
+    # BAD fails upstream, GONE has no bars at all, the rest behave
+    market = FakeMarket(failing={'BAD'}, empty={'GONE'})
+    set_provider(YahooProvider(client=market, rate_limiter=RateLimiter(0, 0), retries=0))
+    provider = get_provider()
+    provider.guard.cooldown = 0.2
+    return market, provider
+
+
+def breaker_state(provider, ticker):
+    return provider.guard.status()['circuit_breakers'].get(ticker, {}).get('state', 'closed')
+
+
+def test_swallowed_download_error_opens_the_breaker(outage):
+    market, provider = outage
+    for attempt in range(provider.guard.max_failures):
+        frames = provider.download(['BAD', 'GC=F'], START, END)
+        # The failed ticker is left out, not answered as "no data"
+        assert 'BAD' not in frames
+        assert not frames['GC=F'].empty
+    assert breaker_state(provider, 'BAD') == 'open'
+    assert provider.guard.status()['negative_cache']['size'] == 0
+
+    # While open, BAD isn't asked for at all
+    before = market.calls['download_tickers'] + market.calls['history']
+    assert 'BAD' not in provider.download(['BAD'], START, END)
+    assert market.calls['download_tickers'] + market.calls['history'] == before
+    with pytest.raises(TickerUnavailable):
+        provider.history('BAD', START, END)
+
+
+def test_raising_history_opens_the_breaker_and_recovers(outage):
+    market, provider = outage
+    for attempt in range(provider.guard.max_failures):
+        with pytest.raises(ConnectionError):
+            provider.history('BAD', START, END)
+    assert breaker_state(provider, 'BAD') == 'open'
+
+    # After the cooldown one trial call goes through; its success closes the breaker
+    market.failing.clear()
+    time.sleep(0.25)
+    assert not provider.history('BAD', START, END).empty
+    assert breaker_state(provider, 'BAD') == 'closed'
+
+
+def test_failed_trial_call_reopens_the_breaker(outage):
+    market, provider = outage
+    for attempt in range(provider.guard.max_failures):
+        provider.download(['BAD'], START, END)
+    time.sleep(0.25)
+    assert provider.guard.allow('BAD')  # the trial call
+    assert not provider.guard.allow('BAD')  # nobody else while it runs
+    provider.guard.record_failure('BAD')
+    assert breaker_state(provider, 'BAD') == 'open'
+
+
+def test_empty_ticker_is_negative_cached_not_failed(outage):
+    market, provider = outage
+    assert provider.download(['GONE'], START, END)['GONE'].empty
+    assert breaker_state(provider, 'GONE') == 'closed'
+    calls = dict(market.calls)
+    # Answered from the negative cache, still as an empty frame
+    assert provider.download(['GONE'], START, END)['GONE'].empty
+    assert dict(market.calls) == calls
+
+
+UNIVERSE = [f'{2000 + i}.TW' for i in range(20)]
+
+
+def test_empty_window_costs_a_few_rechecks(market):
+    # A window without trading days (weekend, exchange holiday) for a whole universe
+    provider = get_provider()
+    frames = provider.download(UNIVERSE, '2024-01-06', '2024-01-08')
+    assert set(frames) == set(UNIVERSE) and all(df.empty for df in frames.values())
+    assert market.calls['download'] == 1
+    assert market.calls['history'] == YAHOO_EMPTY_RECHECKS
+    assert all(breaker_state(provider, ticker) == 'closed' for ticker in UNIVERSE)
+
+
+def test_batch_outage_leaves_every_empty_ticker_out(outage):
+    market, provider = outage
+    market.failing.update(UNIVERSE)
+    frames = provider.download(UNIVERSE + ['GC=F'], START, END)
+    assert set(frames) == {'GC=F'}
+    assert market.calls['history'] == YAHOO_EMPTY_RECHECKS
+    assert provider.guard.status()['negative_cache']['size'] == 0
+
+
+def test_frozen_since():
+    market = FakeMarket(frozen={'ZNC=F': '2024-02-01'})
+    df = market.window('ZNC=F', START, END)
+    # The run starts at the last close before the freeze, which every later bar repeats
+    assert frozen_since(df) == df.index[df.index < '2024-02-01'][-1]
+    assert flat_run(df)[0] == (df.index >= '2024-02-01').sum() + 1
+    assert frozen_since(market.window('GC=F', START, END)) is None
+    # A flat run shorter than FROZEN_MIN_BARS is just a quiet spell
+    assert frozen_since(df, min_bars=len(df)) is None
+
+
+@pytest.fixture
+def frozen_market(backend):
+    market = FakeMarket(frozen={'ZNC=F': '2024-02-01', 'NIKL': '2024-02-01'})
+    set_provider(YahooProvider(client=market, rate_limiter=RateLimiter(0, 0), retries=0))
+    return market
+
+
+def test_frozen_flag_is_stored_with_the_bars(backend, frozen_market, client):
+    backend.load_daily_bars(['ZNC=F', 'GC=F'], '2023-06-01', '2024-03-01')
+    assert backend.bar_store.frozen() == {'ZNC=F': '2024-01-31'}
+    assert client.get('/api/tickers/health').get_json()['frozen'] == {'ZNC=F': '2024-01-31'}
+    # Another worker on the same store, after only a short delta download, sees the same
+    other = BarStore(os.path.dirname(backend.bar_store.path))
+    other.merge('ZNC=F', frozen_market.window('ZNC=F', '2024-03-01', '2024-03-05'), '2024-03-01', '2024-03-05')
+    assert other.frozen(['ZNC=F', 'GC=F']) == {'ZNC=F': '2024-01-31'}
+    # Bars that move again clear it
+    other.merge('ZNC=F', FakeMarket().window('ZNC=F', '2024-03-05', '2024-03-12'), '2024-03-05', '2024-03-12')
+    assert backend.bar_store.frozen() == {}
+
+
+def test_frozen_flag_travels_with_shared_series(backend, frozen_market, client):
+    query = {'stock_ids': ['NIKL', 'FCX'], 'metal': 'Nickel', 'start_date': '2023-06-01', 'end_date': '2024-03-01'}
+
+    def frozen_entries():
+        return {entry['stock_id']: entry.get('frozen_since')
+                for entry in client.post('/api/analyze', json=query).get_json()['stock_results']}
+
+    assert frozen_entries() == {'NIKL': '2024-01-31', 'FCX': None}
+    # Another worker: nothing in process, the series comes from the shared cache without a download
+    backend.series_cache.clear()
+    set_provider(YahooProvider(client=frozen_market, rate_limiter=RateLimiter(0, 0), retries=0))
+    calls = dict(frozen_market.calls)
+    assert frozen_entries() == {'NIKL': '2024-01-31', 'FCX': None}
+    assert dict(frozen_market.calls) == calls
+
+
+@pytest.fixture
+def labels():
+    # Importing the app registers the metal and screener tickers as metric labels
+    import app
+    return app
+
+
+def test_unknown_tickers_share_one_metric_series(outage, labels):
+    from metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS, UPSTREAM_SKIPPED
+    market, provider = outage
+    market.failing.update({'BOGUS1', 'BOGUS2'})
+
+    def series():
+        return {line.split(' ')[0] for metric in (UPSTREAM_ERRORS, UPSTREAM_SECONDS, UPSTREAM_SKIPPED)
+                for line in metric.render() if not line.startswith('#')}
+
+    provider.download(['BOGUS1'], START, END)
+    provider.download(['BOGUS1', 'GC=F'], START, END)
+    before = series()
+    provider.download(['BOGUS2'], START, END)
+    assert series() == before
+    assert not any('BOGUS' in line for line in before)
+    assert any('ticker="other"' in line for line in before)
+
+
+def test_upstream_latency_per_ticker(client):
+    provider = get_provider()
+    provider.download(['GC=F'], START, END)
+    provider.download(['SI=F', 'HG=F'], START, END)
+    provider.download(['NOT.A.METAL'], START, END)
+    lines = [line for line in client.get('/metrics').get_data(as_text=True).splitlines()
+             if line.startswith('metals_upstream_seconds_count')]
+    for ticker in ('GC=F', 'batch', 'other'):
+        assert any('call="download"' in line and f'ticker="{ticker}"' in line for line in lines), ticker
@@ -0,0 +1,37 @@
+import time
+
+from ticker_meta import TickerMetaCache
+
+
+def settle(cache):
+    # Wait for the background lookups to finish
+    deadline = time.monotonic() + 5
+    while cache._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_failed_lookup_is_not_retried_until_it_expires(tmp_path):
+    calls = []
+
+    def resolve(symbol):
+        calls.append(symbol)
+        if symbol == 'BOGUS':
+            raise KeyError(symbol)
+        return {'name': f'{symbol} Inc', 'exchange': 'NYQ', 'currency': 'USD'}
+
+    cache = TickerMetaCache(resolve, path=str(tmp_path / 'meta.json'), failure_ttl=0.2)
+    for attempt in range(3):
+        assert cache.get('BOGUS') is None
+        settle(cache)
+    assert calls == ['BOGUS']
+    assert not (tmp_path / 'meta.json').exists()
+
+    time.sleep(0.25)
+    cache.get('BOGUS')
+    settle(cache)
+    assert calls == ['BOGUS', 'BOGUS']
+
+    cache.get('FCX')
+    settle(cache)
+    assert cache.get('FCX')['name'] == 'FCX Inc'
+    assert calls == ['BOGUS', 'BOGUS', 'FCX']
@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Per-ticker protection in front of the upstream provider (see GuardedProvider in providers.py).
+#
+# - Negative cache: a call (history / download) for a ticker, window and interval that
+#   came back empty is answered empty without asking again for NEGATIVE_CACHE_TTL seconds.
+# - Circuit breaker: after BREAKER_FAILURES consecutive failed calls a ticker's breaker
+#   opens for BREAKER_COOLDOWN seconds. While open, calls get the last good bars (if they
+#   cover the window) or fail at once with TickerUnavailable; after the cooldown a single
+#   trial call decides whether it closes again.
+# - Frozen series: frozen_since() flags a series whose close hasn't moved for FROZEN_MIN_BARS
+#   daily bars or more with the date it froze (e.g. ZNC=F). It runs once at ingest and the flag
+#   is stored with the data (the bar store per ticker, the shared series cache per series), so
+#   every worker reports the same thing and nobody checks per request. Only daily bars go
+#   there: ten flat 5m bars are just a quiet hour.
+NEGATIVE_CACHE_TTL = float(os.environ.get('NEGATIVE_CACHE_TTL', 300))
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', 3))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', 60))
+FROZEN_MIN_BARS = int(os.environ.get('FROZEN_MIN_BARS', 10))
+LAST_GOOD_SIZE = int(os.environ.get('LAST_GOOD_SIZE', 256))
+
+
+class TickerUnavailable(Exception):
+    pass
+
+
+def _day(value):
+    return None if value is None else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def flat_run(df):
+    """(bars, total, since) for the trailing run of bars with an unchanged close.
+
+    bars counts the closes in that run, total all closes in the frame and since is the
+    run's first date; (0, 0, None) when there are no closes at all.
+    """
+    if df is None or 'Close' not in df.columns:
+        return 0, 0, None
+    close = df['Close'].to_numpy(dtype='float64')
+    valid = np.flatnonzero(~np.isnan(close))
+    if not len(valid):
+        return 0, 0, None
+    values = close[valid]
+    changed = np.flatnonzero(values[1:] != values[:-1])
+    first = changed[-1] + 1 if len(changed) else 0
+    return len(values) - first, len(values), df.index[valid[first]]
+
+
+def frozen_since(df, min_bars=FROZEN_MIN_BARS):
+    # First date of the trailing flat run of closes if it's at least min_bars long, else None
+    bars, total, since = flat_run(df)
+    return since if bars >= min_bars else None
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+
+class TickerGuard:
+    def __init__(self, negative_ttl=NEGATIVE_CACHE_TTL, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN,
+                 last_good_size=LAST_GOOD_SIZE):
+        self.negative_ttl = negative_ttl
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.last_good_size = last_good_size
+        self._negative = {}  # (call, ticker, start, end, interval) -> expires_at
+        self._breakers = {}  # ticker -> _Breaker
+        self._last_good = OrderedDict()  # (ticker, interval) -> OHLCV frame
+        self._lock = threading.Lock()
+
+    # Negative cache
+
+    def is_empty(self, call, ticker, start, end, interval):
+        key = (call, ticker, _day(start), _day(end), interval)
+        with self._lock:
+            expires_at = self._negative.get(key)
+            if expires_at is None:
+                return False
+            if expires_at > time.monotonic():
+                return True
+            del self._negative[key]
+            return False
+
+    def remember_empty(self, call, ticker, start, end, interval):
+        now = time.monotonic()
+        with self._lock:
+            self._negative[(call, ticker, _day(start), _day(end), interval)] = now + self.negative_ttl
+            # Drop expired entries now and then so the dict doesn't grow with every window ever asked for
+            if len(self._negative) > 4 * self.last_good_size:
+                self._negative = {key: expires for key, expires in self._negative.items() if expires > now}
+
+    # Circuit breaker
+
+    def allow(self, ticker):
+        """Whether a call for `ticker` may go upstream now (claims the trial call when half-open)."""
+        with self._lock:
+            breaker = self._breakers.get(ticker)
+            if breaker is None or breaker.opened_at is None:
+                return True
+            if breaker.probing or time.monotonic() - breaker.opened_at < self.cooldown:
+                return False
+            breaker.probing = True
+            return True
+
+    def record_success(self, ticker):
+        with self._lock:
+            self._breakers.pop(ticker, None)
+
+    def record_failure(self, ticker):
+        with self._lock:
+            breaker = self._breakers.setdefault(ticker, _Breaker())
+            breaker.failures += 1
+            if breaker.probing or breaker.failures >= self.max_failures:
+                breaker.opened_at = time.monotonic()
+                breaker.probing = False
+
+    def retry_in(self, ticker):
+        with self._lock:
+            breaker = self._breakers.get(ticker)
+            if breaker is None or breaker.opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - breaker.opened_at))
+
+    # Last good data
+
+    def remember_good(self, ticker, interval, df):
+        with self._lock:
+            self._last_good[(ticker, interval)] = df
+            self._last_good.move_to_end((ticker, interval))
+            while len(self._last_good) > self.last_good_size:
+                self._last_good.popitem(last=False)
+
+    def last_good(self, ticker, start, end, interval):
+        # Last good bars within [start, end), or None if we have nothing for that window
+        with self._lock:
+            df = self._last_good.get((ticker, interval))
+        if df is None:
+            return None
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df.index < pd.Timestamp(end)]
+        return None if df.empty else df
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            breakers = {}
+            for ticker, breaker in self._breakers.items():
+                if breaker.opened_at is None:
+                    state, retry_in = 'closed', 0.0
+                elif breaker.probing:
+                    state, retry_in = 'half_open', 0.0
+                else:
+                    state, retry_in = 'open', max(0.0, self.cooldown - (now - breaker.opened_at))
+                breakers[ticker] = {'state': state, 'failures': breaker.failures, 'retry_in_seconds': round(retry_in, 1)}
+            return {
+                'circuit_breakers': breakers,
+                'negative_cache': {
+                    'size': sum(expires > now for expires in self._negative.values()),
+                    'ttl_seconds': self.negative_ttl,
+                },
+            }
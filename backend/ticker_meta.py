@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bar_store import BAR_STORE_DIR
+
+# Display metadata (name, exchange, currency, resolved symbol) per ticker, kept on disk.
+# Ticker.info is one of the slowest Yahoo calls and names practically never change, so
+# requests only read from here; misses and stale entries are resolved in the background.
+TICKER_META_FILE = os.environ.get('TICKER_META_FILE', os.path.join(BAR_STORE_DIR, 'ticker_meta.json'))
+TICKER_META_TTL = float(os.environ.get('TICKER_META_TTL', 30 * 24 * 3600))
+# A failed lookup (unknown symbol, upstream down) isn't retried for this long. Failures are
+# only remembered in memory: nothing is written, and each worker retries on its own.
+TICKER_META_FAILURE_TTL = float(os.environ.get('TICKER_META_FAILURE_TTL', 600))
+
+
+class TickerMetaCache:
+    def __init__(self, resolve, path=TICKER_META_FILE, ttl=TICKER_META_TTL, failure_ttl=TICKER_META_FAILURE_TTL):
+        self._resolve = resolve  # symbol -> {'name', 'exchange', 'currency'}
+        self.path = path
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failed = {}  # symbol -> time.monotonic() from which it may be looked up again
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ticker-meta')
+        self._entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, symbol, entry):
+        with self._lock:
+            # Merge with what other gunicorn workers may have written in the meantime
+            entries = self._read()
+            entries.update(self._entries)
+            entries[symbol] = entry
+            self._entries = entries
+
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, symbol):
+        """Return cached metadata for `symbol` (possibly stale) or None, never blocking on Yahoo."""
+        entry = self._entries.get(symbol)
+        if entry is None or time.time() - entry.get('fetched_at', 0) > self.ttl:
+            self._schedule(symbol)
+        return entry
+
+    def _schedule(self, symbol):
+        with self._lock:
+            if symbol in self._pending or self._failed.get(symbol, 0) > time.monotonic():
+                return
+            self._pending.add(symbol)
+        self._pool.submit(self._refresh, symbol)
+
+    def _refresh(self, symbol):
+        try:
+            entry = self._resolve(symbol)
+            entry['symbol'] = symbol
+            entry['fetched_at'] = time.time()
+            self._write(symbol, entry)
+        except Exception as e:
+            print(f"Metadata lookup failed for {symbol}: {e}")
+            now = time.monotonic()
+            with self._lock:
+                # Drop expired failures now and then so unknown symbols don't pile up
+                if len(self._failed) > 1024:
+                    self._failed = {failed: retry_at for failed, retry_at in self._failed.items() if retry_at > now}
+                self._failed[symbol] = now + self.failure_ttl
+        finally:
+            with self._lock:
+                self._pending.discard(symbol)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# Price series from different exchanges (TWSE / TPEx, Tokyo, London, COMEX...) put on one
+# shared axis of calendar days. Each series is normalized once -- timezone dropped, one
+# value per day -- into a dense float64 column plus a validity mask over that axis.
+# Aligning a pair or any subset is then an AND (or OR) of masks and a gather, instead of
+# a pd.concat hash join per comparison.
+
+
+def day_numbers(index):
+    # Date index -> int64 days since 1970-01-01, on the exchange's own (local) calendar
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_numpy().astype('datetime64[D]').astype('int64')
+
+
+class TradingCalendar:
+    def __init__(self):
+        self.first_day = 0
+        self.n_days = 0
+        self._values = {}  # key -> float64[n_days], NaN where the series has no price
+        self._masks = {}   # key -> bool[n_days]
+
+    def __contains__(self, key):
+        return key in self._masks
+
+    def add(self, key, series):
+        """Put a date-indexed series on the axis under `key`. Returns its number of valid days."""
+        days = day_numbers(series.index)
+        if len(days):
+            self._extend(days.min(), days.max())
+        column = np.full(self.n_days, np.nan)
+        column[days - self.first_day] = series.to_numpy(dtype='float64')
+        mask = ~np.isnan(column)
+        self._values[key] = column
+        self._masks[key] = mask
+        return int(mask.sum())
+
+    def _extend(self, first_day, last_day):
+        # Grow the axis to cover [first_day, last_day]; only happens when a series reaches
+        # outside every range seen so far
+        if self.n_days == 0:
+            self.first_day = first_day
+        before = max(0, self.first_day - first_day)
+        after = max(0, last_day - (self.first_day + self.n_days - 1))
+        if not before and not after:
+            return
+        for key in self._values:
+            self._values[key] = np.pad(self._values[key], (before, after), constant_values=np.nan)
+            self._masks[key] = np.pad(self._masks[key], (before, after))
+        self.first_day -= before
+        self.n_days += before + after
+
+    def mask(self, keys, how='all'):
+        # Days on which every series ('all') or at least one ('any') has a price
+        masks = [self._masks[key] for key in keys]
+        if not masks:
+            return np.zeros(self.n_days, dtype=bool)
+        return np.logical_and.reduce(masks) if how == 'all' else np.logical_or.reduce(masks)
+
+    def overlap(self, *keys):
+        return int(np.count_nonzero(self.mask(keys)))
+
+    def dates(self, rows):
+        return pd.DatetimeIndex((self.first_day + rows).astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+
+    def gather(self, keys, how='all'):
+        """(rows, values): the selected day positions and a len(rows) x len(keys) matrix.
+
+        how='all' is concat + dropna; how='any' is the union of dates with NaN gaps.
+        """
+        rows = np.flatnonzero(self.mask(keys, how))
+        values = np.empty((len(rows), len(keys)))
+        for i, key in enumerate(keys):
+            values[:, i] = self._values[key][rows]
+        return rows, values
+
+    def frame(self, columns, how='all'):
+        # {column name: key} -> date-indexed DataFrame over the gathered days
+        rows, values = self.gather(list(columns.values()), how)
+        return pd.DataFrame(values, index=self.dates(rows), columns=list(columns))
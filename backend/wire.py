@@ -0,0 +1,106 @@
+import os
+import gzip
+import zlib
+
+from flask.json.provider import DefaultJSONProvider
+
+# Wire encoding: response compression negotiated from Accept-Encoding, and a faster
+# JSON encoder. Both brotli and orjson are optional; without them responses fall back
+# to gzip and the stdlib json module.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))  # 11 is much slower for a few % less
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+
+# Bodies worth compressing on the fly (Parquet exports are compressed already)
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/csv', 'application/vnd.apache.arrow.stream'}
+
+# In order of preference when the client accepts several with the same quality
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz'}
+
+
+def negotiate_encoding(accept_encodings):
+    # werkzeug Accept-Encoding header -> 'br' / 'gzip' / None (identity)
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def compress_stream(chunks, encoding):
+    # Incremental compression for streamed bodies, flushed after every chunk so each
+    # event still reaches the client as soon as it is produced
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk.encode()) + compressor.flush()
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def compress_response(response, accept_encodings):
+    # Compress a finished JSON (or export) response in place if the client accepts it and it is worth it
+    if response.is_streamed or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding(accept_encodings)
+    if encoding is None:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson when installed. Output matches Flask's provider (sorted keys, compact) except
+    # float formatting details and NaN, which orjson writes as null.
+    def _options(self, sort_keys):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        return options | orjson.OPT_SORT_KEYS if sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+        sort_keys = kwargs.get('sort_keys', self.sort_keys)
+        return orjson.dumps(obj, default=self.default, option=self._options(sort_keys)).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Pretty-printed in debug mode like the default provider; otherwise skip the str round trip
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self._options(self.sort_keys)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)